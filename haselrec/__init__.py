@@ -2,23 +2,65 @@
 haselREC (HAzard-based SELection of RECords)
 """
 
-from haselrec.check_module import check_module
-from haselrec.compute_avgSA import compute_rho_avgsa
-from haselrec.compute_cs import compute_cs
-from haselrec.create_acc import create_esm_acc, create_nga_acc
-from haselrec.create_output_files import create_output_files
-from haselrec.find_ground_motion import find_ground_motion
-from haselrec.input_GMPE import compute_dists, inizialize_gmm, \
-    compute_soil_params, compute_source_params
-from haselrec.optimize_ground_motion import optimize_ground_motion
-from haselrec.plot_final_selection import plot_final_selection
-from haselrec.read_input_data import read_input_data
-from haselrec.scale_acc import scale_acc
-from haselrec.scaling_module import scaling_module
-from haselrec.screen_database import screen_database
-from haselrec.selection_module import selection_module
-from haselrec.simulate_spectra import simulate_spectra
-from haselrec.compute_conditioning_value import compute_conditioning_value
+import sys
+import types
+
+__version__ = '1.1'
+
+# public functions and classes, by name, and the modules defining them:
+# they are imported on first access (PEP 562), so that importing the
+# package, or running a mode of the command line interface, only loads
+# the modules actually used
+_lazy = {
+    'anneal_ground_motion': 'anneal_ground_motion',
+    'batch_module': 'batch_module',
+    'create_spectra_store': 'candidate_store',
+    'prepare_spectra_store': 'candidate_store',
+    'check_module': 'check_module',
+    'save_checkpoint': 'checkpoint',
+    'load_checkpoint': 'checkpoint',
+    'objective_key': 'checkpoint',
+    'remove_checkpoint': 'checkpoint',
+    'compute_rho_avgsa': 'compute_avgSA',
+    'compute_cs': 'compute_cs',
+    'compute_ln_sa1': 'compute_scale_factors',
+    'compute_scale_factors': 'compute_scale_factors',
+    'create_esm_acc': 'create_acc',
+    'create_nga_acc': 'create_acc',
+    'create_output_files': 'create_output_files',
+    'find_ground_motion': 'find_ground_motion',
+    'case_fingerprint': 'fingerprint',
+    'parse_only': 'fingerprint',
+    'compute_dists': 'input_GMPE',
+    'inizialize_gmm': 'input_GMPE',
+    'compute_soil_params': 'input_GMPE',
+    'compute_source_params': 'input_GMPE',
+    'milp_ground_motion': 'milp_ground_motion',
+    'optimize_ground_motion': 'optimize_ground_motion',
+    'prune_candidates': 'prune_candidates',
+    'plot_final_selection': 'plot_final_selection',
+    'read_input_data': 'read_input_data',
+    'read_previous_selection': 'read_previous_selection',
+    'scale_acc': 'scale_acc',
+    'scaling_module': 'scaling_module',
+    'score_candidates': 'score_candidates',
+    'screen_database': 'screen_database',
+    'read_database': 'screen_database',
+    'select_ground_motions': 'select_ground_motions',
+    'multi_start_selection': 'select_ground_motions',
+    'select': 'selection_api',
+    'serve': 'selection_server',
+    'SelectionConfig': 'selection_api',
+    'SelectionResult': 'selection_api',
+    'selection_case': 'selection_case',
+    'selection_module': 'selection_module',
+    'simulate_spectra': 'simulate_spectra',
+    'stage_key': 'stage_cache',
+    'cached_stage': 'stage_cache',
+    'start_metrics': 'metrics',
+    'stage_metrics': 'metrics',
+    'compute_conditioning_value': 'compute_conditioning_value',
+}
 
 __all__ = [
     'simulate_spectra',
@@ -41,4 +83,63 @@ __all__ = [
     'create_nga_acc',
     'check_module',
     'compute_conditioning_value',
+    'compute_ln_sa1',
+    'compute_scale_factors',
+    'prune_candidates',
+    'score_candidates',
+    'anneal_ground_motion',
+    'select_ground_motions',
+    'multi_start_selection',
+    'save_checkpoint',
+    'load_checkpoint',
+    'objective_key',
+    'remove_checkpoint',
+    'read_previous_selection',
+    'create_spectra_store',
+    'prepare_spectra_store',
+    'milp_ground_motion',
+    'selection_case',
+    'read_database',
+    'case_fingerprint',
+    'parse_only',
+    'stage_key',
+    'cached_stage',
+    'start_metrics',
+    'stage_metrics',
+    'select',
+    'SelectionConfig',
+    'SelectionResult',
+    'serve',
+    'batch_module',
 ]
+
+
+def __getattr__(name):
+    import importlib
+
+    if name not in _lazy:
+        raise AttributeError("module 'haselrec' has no attribute " + repr(name))
+    value = getattr(importlib.import_module('haselrec.' + _lazy[name]), name)
+    # the function replaces the submodule of the same name, as the former
+    # eager imports did
+    globals()[name] = value
+    return value
+
+
+def __dir__():
+    return sorted(list(globals()) + __all__)
+
+
+class _Package(types.ModuleType):
+    """
+    The package keeps its public functions as attributes when the submodules
+    with the same name are imported (the import system would replace them
+    with the submodules).
+    """
+    def __setattr__(self, name, value):
+        if name in _lazy and isinstance(value, types.ModuleType):
+            return
+        super().__setattr__(name, value)
+
+
+sys.modules[__name__].__class__ = _Package
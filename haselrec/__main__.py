@@ -42,6 +42,34 @@ Four modes are permitted:
        on the computer (it requires to have run mode :code:`--run-selection` in
        advance)
 
+Options:
+
+    - :code:`--jobs N`: the selection of the cases (site, probability of
+      exceedance and intensity measure) is performed on a pool of N processes
+    - :code:`--force`: all cases are computed again, also those whose outputs
+      are up to date with the inputs (by default they are skipped)
+    - :code:`--only site=<site>,poe=<num_poe>,im=<IM>`: only the cases
+      matching the filter are processed (each key is optional and can be
+      repeated, e.g. :code:`--only site=1,site=2,im=PGA`)
+
+Several input files (jobs) can be run together::
+
+    python -m haselrec --batch <input_files> [mode] [options]
+
+The database and hazard files shared by the jobs are read once and the cases
+of all jobs are processed on the same pool of processes (option
+:code:`--jobs`). The default mode is :code:`--run-complete`.
+
+haselREC can also run as a server, which accepts selection jobs over HTTP
+and keeps the database and the GMM classes in memory between the jobs (see
+:code:`selection_server` module)::
+
+    python -m haselrec --serve [--host H] [--port N] [--jobs N]
+
+It listens on `127.0.0.1:8000` by default and runs the jobs on a pool of N
+processes (default 1). Since it has no authentication, the host must be a
+loopback address.
+
 The output files are store in a folder, which has the following name structure::
 
     <IM>-site_<num_site>-poe-<num_poe>
@@ -56,12 +84,58 @@ where:
 import sys
 import os
 from .read_input_data import read_input_data
-from .scaling_module import scaling_module
-from .check_module import check_module
-from .selection_module import selection_module
 
 if __name__ == '__main__':
 
+    # Options
+    n_jobs = 1
+    if '--jobs' in sys.argv:
+        try:
+            n_jobs = int(sys.argv[sys.argv.index('--jobs') + 1])
+        except (IndexError, ValueError):
+            sys.exit('Error: --jobs must be followed by the number of '
+                     'processes')
+
+    force = '--force' in sys.argv
+    only = None
+    if '--only' in sys.argv:
+        from .fingerprint import parse_only
+        try:
+            only = parse_only(sys.argv[sys.argv.index('--only') + 1])
+        except IndexError:
+            sys.exit('Error: --only must be followed by site=...,poe=...,'
+                     'im=...')
+
+    # Batch mode: all the input files following --batch
+    if '--batch' in sys.argv:
+        from .batch_module import batch_module
+        fileinis = [arg for arg in sys.argv[sys.argv.index('--batch') + 1:]
+                    if arg.endswith('.ini')]
+        if len(fileinis) == 0:
+            sys.exit('Error: --batch must be followed by the input files')
+        modes = [arg for arg in sys.argv if arg in
+                 ['--run-complete', '--run-selection', '--run-scaling',
+                  '--check-NGArec']]
+        calculation_mode = modes[0] if modes else '--run-complete'
+        batch_module(fileinis, calculation_mode, n_jobs, force, only)
+        sys.exit()
+
+    # Server mode
+    if '--serve' in sys.argv:
+        from .selection_server import serve
+        host = '127.0.0.1'
+        port = 8000
+        try:
+            if '--host' in sys.argv:
+                host = sys.argv[sys.argv.index('--host') + 1]
+            if '--port' in sys.argv:
+                port = int(sys.argv[sys.argv.index('--port') + 1])
+        except (IndexError, ValueError):
+            sys.exit('Error: --host and --port must be followed by the host '
+                     'and the port number')
+        serve(host, port, n_jobs)
+        sys.exit()
+
     # %% Initial setup
     try:
         fileini = sys.argv[1]
@@ -72,8 +146,14 @@ if __name__ == '__main__':
                  + '       [--run-complete]' + "\n"
                  + '       [--run-selection]' + "\n"
                  + '       [--run-scaling]' + "\n"
-                 + '       [--check-NGArec]')
-
+                 + '       [--check-NGArec]' + "\n"
+                 + '       [--jobs N]' + "\n"
+                 + '       [--force]' + "\n"
+                 + '       [--only site=...,poe=...,im=...]' + "\n"
+                 + 'python -m haselrec --batch #input_files [mode] '
+                 + '[options]' + "\n"
+                 + 'python -m haselrec --serve [--host H] [--port N] '
+                 + '[--jobs N]')
 
     # Read fileini
 
@@ -86,10 +166,18 @@ if __name__ == '__main__':
      database_path, allowed_database, allowed_recs_vs30, allowed_ec8_code,
      maxsf_input, radius_dist_input, radius_mag_input, allowed_depth, n_gm,
      random_seed, n_trials, weights, n_loop, penalty, path_nga_folder,
-     path_esm_folder, output_folder] = read_input_data(fileini)
+     path_esm_folder, output_folder, trials_tol, max_trials,
+     max_trials_time, matching, prune_sigma,
+     prune_fraction, n_workers, optimizer, max_evaluations,
+     max_optimization_time, n_starts, backend,
+     warm_start, checkpoint_interval,
+     extend_selection, spectra_store, block_size,
+     milp_threshold, stage_cache, metrics_file] = read_input_data(fileini)
 
     if calculation_mode == '--run-complete' or \
             calculation_mode == '--run-selection':
+        # each mode imports only the modules it uses
+        from .selection_module import selection_module
 
         selection_module(intensity_measures, site_code, rlz_code,
                          path_results_classical, path_results_disagg,
@@ -103,18 +191,28 @@ if __name__ == '__main__':
                          allowed_recs_vs30, allowed_ec8_code, maxsf_input,
                          radius_dist_input, radius_mag_input, allowed_depth,
                          n_gm, random_seed, n_trials, weights, n_loop, penalty,
-                         output_folder)
+                         output_folder, trials_tol, max_trials,
+                         max_trials_time, matching, prune_sigma,
+                         prune_fraction, n_workers, optimizer,
+                         max_evaluations, max_optimization_time, n_starts,
+                         backend, warm_start, checkpoint_interval,
+                         extend_selection, spectra_store, block_size,
+                         milp_threshold, n_jobs, force, only,
+                         stage_cache, metrics_file)
 
     if calculation_mode == '--check-NGArec':
+        from .check_module import check_module
         check_module(output_folder, site_code, probability_of_exceedance_num,
                      intensity_measures, n_gm, path_nga_folder)
 
     if calculation_mode == '--run-complete' or \
             calculation_mode == '--run-scaling':
+        from .scaling_module import scaling_module
         if not os.path.exists(path_nga_folder):
             os.makedirs(path_nga_folder)
         if not os.path.exists(path_esm_folder):
             os.makedirs(path_esm_folder)
         scaling_module(site_code, probability_of_exceedance_num,
                        intensity_measures, output_folder, n_gm,
-                       path_nga_folder, path_esm_folder)
+                       path_nga_folder, path_esm_folder, force, only,
+                       metrics_file)
@@ -0,0 +1,230 @@
+# Copyright (C) 2020-2021 Elisa Zuccolo, Eucentre Foundation
+#
+# haselREC is free software: you can redistribute it and/or modify it
+# under the terms of the GNU Affero General Public License as published
+# by the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# haselREC is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with haselREC. If not, see <http://www.gnu.org/licenses/>.
+
+def anneal_ground_motion(n_loop, n_gm, sample_small, n_big, id_sel, ln_sa1,
+                         maxsf, sample_big, tgt_per, mean_req, stdevs,
+                         weights, penalty, rec_id, im_scale_fac,
+                         random_seed=333, max_evaluations=None,
+                         max_time=None, checkpoint=None,
+                         checkpoint_interval=60., n_pinned=0,
+                         block_size=None):
+    """
+    Alternative to :code:`optimize_ground_motion`: it optimizes the fit of the
+    initially selected ground motion set to the target spectrum distribution
+    by simulated annealing, so that the optimization is not stuck in the first
+    local minimum found.
+
+    At each step, a random ground motion of the set is swapped with a random
+    candidate ground motion with allowable scale factor. The swap is accepted
+    if it reduces the deviation from the target or, with a probability
+    decreasing with the temperature, if it increases it. The temperature
+    decreases geometrically until :code:`max_evaluations` swaps have been
+    evaluated or :code:`max_time` seconds have passed (by default,
+    :code:`n_loop` * 1000 swaps for each ground motion of the set). The
+    deviation of each swap is computed incrementally from the sums and sums of
+    squares of the set.
+
+    It returns the best set found and a trace with, for each block of
+    :code:`n_gm` * 100 swaps, the deviation of the best set, the number of
+    accepted swaps and the computation time (block 0 is the initial set).
+
+    As for :code:`optimize_ground_motion`, when a :code:`checkpoint` file is
+    given the state of the optimization (current and best sets, temperature
+    schedule, random generator) is saved to it every
+    :code:`checkpoint_interval` seconds and when the optimization is
+    interrupted (SIGINT), in which case the best set found so far is
+    returned. The optimization is resumed from the checkpoint when the
+    function is called again for the same case and objective (and random
+    seed).
+
+    The ground motions in the first :code:`n_pinned` slots of the set are
+    never swapped.
+
+    When :code:`block_size` is given, the scaled log-spectra of the candidates
+    are not stored: they are computed for each evaluated swap from
+    :code:`sample_big` (which can be memory-mapped).
+    """
+    import time
+    import numpy as np
+    from .score_candidates import prepare_candidates, score_candidates, \
+        score_set, candidate_deviations
+    from .checkpoint import load_checkpoint, save_checkpoint, \
+        remove_checkpoint, objective_key
+    from .metrics import count
+
+    sample_small = np.array(sample_small)
+    rec_id = np.array(rec_id)
+    random = np.random.RandomState(random_seed)
+
+    if max_evaluations is None and max_time is None:
+        max_evaluations = n_loop * n_gm * 1000
+
+    scale_fac, dev_big, not_allowed, n_exceed = \
+        prepare_candidates(sample_big, id_sel, ln_sa1, maxsf, mean_req,
+                           stdevs, penalty, block_size)
+
+    def candidate_dev(rows):
+        # scaled log-spectra of the candidates minus the target mean
+        if dev_big is None:
+            return candidate_deviations(sample_big, scale_fac, mean_req, rows)
+        return dev_big[rows]
+    allowed = np.where(~not_allowed)[0]
+    assert (len(allowed) > n_gm), (
+        'Warning: there are not enough ground motions with allowable scale '
+        'factor')
+
+    # current set
+    in_set = np.zeros(n_big, dtype=bool)
+    in_set[rec_id] = True
+    dev_small = sample_small - mean_req
+    sum_dev = np.sum(dev_small, axis=0)
+    sum_sq = np.sum(dev_small ** 2, axis=0)
+    sum_exceed = np.sum(n_exceed[rec_id])
+    current = score_set(sum_dev, sum_sq, n_gm, stdevs, weights) + \
+        sum_exceed * penalty
+
+    best = current
+    best_id = rec_id.copy()
+    trace = [(0, best, 0, 0.)]
+
+    # initial temperature: a swap increasing the deviation by 10% of the
+    # initial one is accepted with a probability of about 1/e (floored, so
+    # that the schedule is defined when the initial set matches the target)
+    temperature_start = max(0.1 * current, 1e-12)
+    temperature_end = 1e-4 * temperature_start
+    block = n_gm * 100
+
+    start = time.time()
+    block_start = start
+    n_accepted = 0
+    evaluation = 0
+
+    # Resume from the checkpoint of an interrupted optimization
+    objective = objective_key(
+        n_gm=n_gm, n_big=n_big, ln_sa1=ln_sa1, maxsf=maxsf,
+        mean_req=mean_req, stdevs=stdevs, weights=weights, penalty=penalty,
+        scale_factors=scale_fac, pinned=rec_id[:n_pinned],
+        random_seed=random_seed)
+    state = load_checkpoint(checkpoint, 'annealing', objective)
+    if state is not None:
+        rec_id = state['rec_id']
+        in_set[:] = False
+        in_set[rec_id] = True
+        dev_small = candidate_dev(rec_id)
+        sum_dev = np.sum(dev_small, axis=0)
+        sum_sq = np.sum(dev_small ** 2, axis=0)
+        sum_exceed = np.sum(n_exceed[rec_id])
+        current = score_set(sum_dev, sum_sq, n_gm, stdevs, weights) + \
+            sum_exceed * penalty
+        best = float(state['best'])
+        best_id = state['best_id']
+        trace = [tuple(row) for row in state['trace']]
+        temperature_start = float(state['temperature_start'])
+        temperature_end = 1e-4 * temperature_start
+        start = time.time() - float(state['elapsed'])
+        block_start = time.time() - float(state['block_elapsed'])
+        n_accepted = int(state['n_accepted'])
+        evaluation = int(state['evaluation'])
+        random.set_state(('MT19937', state['random_keys'],
+                          int(state['random_pos']), 0, 0.))
+
+    def save():
+        random_state = random.get_state()
+        save_checkpoint(checkpoint, rec_id=rec_id, best_id=best_id,
+                        best=best, trace=np.array(trace),
+                        temperature_start=temperature_start,
+                        elapsed=time.time() - start,
+                        block_elapsed=time.time() - block_start,
+                        n_accepted=n_accepted, evaluation=evaluation,
+                        random_keys=random_state[1],
+                        random_pos=random_state[2], optimizer='annealing',
+                        objective=objective)
+
+    last_save = time.time()
+    interrupted = False
+    first_evaluation = evaluation
+    try:
+        while True:
+            if (checkpoint is not None and
+                    time.time() - last_save >= checkpoint_interval):
+                save()
+                last_save = time.time()
+            if max_evaluations is not None:
+                progress = evaluation / max_evaluations
+            else:
+                progress = 0
+            if max_time is not None:
+                progress = max(progress, (time.time() - start) / max_time)
+            if progress >= 1:
+                break
+            temperature = temperature_start * (
+                temperature_end / temperature_start) ** progress
+
+            # swap a random ground motion of the set with a random candidate
+            i = n_pinned + random.randint(n_gm - n_pinned)
+            j = allowed[random.randint(len(allowed))]
+            if not in_set[j]:
+                new_sum_dev = sum_dev - dev_small[i, :]
+                new_sum_sq = sum_sq - dev_small[i, :] ** 2
+                new_sum_exceed = sum_exceed - n_exceed[rec_id[i]] + \
+                    n_exceed[j]
+                new = score_candidates(new_sum_dev, new_sum_sq, n_gm,
+                                       candidate_dev([j]), stdevs,
+                                       weights)[0] + new_sum_exceed * penalty
+                if new < current or random.rand() < np.exp(
+                        (current - new) / temperature):
+                    in_set[rec_id[i]] = False
+                    in_set[j] = True
+                    rec_id[i] = j
+                    dev_small[i, :] = candidate_dev(j)
+                    sum_dev = new_sum_dev + dev_small[i, :]
+                    sum_sq = new_sum_sq + dev_small[i, :] ** 2
+                    sum_exceed = new_sum_exceed
+                    current = new
+                    n_accepted += 1
+                    if current < best:
+                        best = current
+                        best_id = rec_id.copy()
+
+            evaluation += 1
+            if evaluation % block == 0:
+                trace.append((len(trace), best, n_accepted,
+                              time.time() - block_start))
+                count('swaps', n_accepted)
+                block_start = time.time()
+                n_accepted = 0
+                # sums are recomputed to avoid the accumulation of round-off
+                sum_dev = np.sum(dev_small, axis=0)
+                sum_sq = np.sum(dev_small ** 2, axis=0)
+    except KeyboardInterrupt:
+        # Save the state and return the best set found so far
+        interrupted = True
+        if checkpoint is not None:
+            save()
+            print('Optimization interrupted: state saved to ' + checkpoint)
+
+    if evaluation % block != 0:
+        trace.append((len(trace), best, n_accepted,
+                      time.time() - block_start))
+        count('swaps', n_accepted)
+    count('candidate_evaluations', evaluation - first_evaluation)
+    if not interrupted:
+        remove_checkpoint(checkpoint)
+
+    rec_id = best_id
+    im_scale_fac = scale_fac[rec_id]
+    sample_small = candidate_dev(rec_id) + mean_req
+    print(['Number of swaps evaluated = ', evaluation])
+    return rec_id, im_scale_fac, sample_small, trace
@@ -0,0 +1,127 @@
+# Copyright (C) 2020-2021 Elisa Zuccolo, Eucentre Foundation
+#
+# haselREC is free software: you can redistribute it and/or modify it
+# under the terms of the GNU Affero General Public License as published
+# by the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# haselREC is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with haselREC. If not, see <http://www.gnu.org/licenses/>.
+
+def batch_module(fileinis, calculation_mode, n_jobs=1, force=False,
+                 only=None):
+    """
+    This module is called when option :code:`--batch` is specified: it runs
+    :code:`calculation_mode` for all the input files :code:`fileinis` (jobs)
+    together.
+
+    The jobs are planned before running any of them: each database file (and
+    spectra store) and each OpenQuake output file used by the jobs is read
+    once, and the selection cases of all jobs are scheduled on a single pool
+    of :code:`n_jobs` processes (see :code:`selection_module`). The scaling
+    and the check of the NGA-West2 records are then performed for each job.
+    """
+    import os
+    import sys
+    from .read_input_data import read_input_data
+    from .screen_database import read_database
+    from .candidate_store import prepare_spectra_store
+    from .compute_conditioning_value import read_hazard_file, hazard_files
+    from .selection_api import _INI_FIELDS
+    from .selection_case import selection_case, list_cases, case_tasks, \
+        run_tasks
+
+    jobs = []
+    for fileini in fileinis:
+        print('Reading ' + fileini)
+        jobs.append(dict(zip(_INI_FIELDS, read_input_data(fileini))))
+
+    # Two jobs must not write the same case in the same folder
+    names = {}
+    for fileini, job in zip(fileinis, jobs):
+        for ind, ii, jj, im in list_cases(job['site_code'],
+                                          job['probability_of_exceedance_num'],
+                                          job['intensity_measures']):
+            name = (os.path.abspath(job['output_folder']) + '/' +
+                    job['intensity_measures'][im] + '-site_' +
+                    str(job['site_code'][ii]) + '-poe-' +
+                    str(job['probability_of_exceedance_num'][jj]))
+            if name in names:
+                sys.exit('Error: ' + fileini + ' and ' + names[name] +
+                         ' write the same case ' + name)
+            names[name] = fileini
+
+    if calculation_mode == '--run-complete' or \
+            calculation_mode == '--run-selection':
+        print('Inputs loaded, starting selection....')
+
+        # Shared inputs, read once (before the processes of the pool are
+        # forked): database files and OpenQuake output files
+        databases = {}
+        inputs = []
+        job_cases = []
+        tasks = []
+        for job in jobs:
+            store = job['spectra_store']
+            if store is not None:
+                prepare_spectra_store(job['database_path'], store)
+            key = (os.path.abspath(job['database_path']), store)
+            if key not in databases:
+                databases[key] = read_database(job['database_path'], store)
+
+            cases = list_cases(job['site_code'],
+                               job['probability_of_exceedance_num'],
+                               job['intensity_measures'])
+            for ind, ii, jj, im in cases:
+                for path in hazard_files(
+                        job['rlz_code'][ii], job['intensity_measures'][im],
+                        job['site_code'][ii],
+                        job['probability_of_exceedance_num'][jj],
+                        job['num_disagg'], job['num_classical'],
+                        job['path_results_disagg'],
+                        job['path_results_classical']):
+                    if os.path.isfile(path):
+                        read_hazard_file(path)
+
+            job_inputs = {key: value for key, value in job.items() if key
+                          not in ['path_nga_folder', 'path_esm_folder']}
+            job_inputs.update(database=databases[key], force=force,
+                              only=only)
+            inputs.append(job_inputs)
+            job_cases.append(cases)
+            tasks.extend(case_tasks(len(inputs) - 1, cases,
+                                    job['warm_start']))
+
+        if n_jobs == 1:
+            for job in range(len(inputs)):
+                selection_case(job_cases[job], **inputs[job])
+        else:
+            run_tasks(inputs, tasks, n_jobs)
+
+    for job in jobs:
+        if calculation_mode == '--check-NGArec':
+            from .check_module import check_module
+            check_module(job['output_folder'], job['site_code'],
+                         job['probability_of_exceedance_num'],
+                         job['intensity_measures'], job['n_gm'],
+                         job['path_nga_folder'])
+
+        if calculation_mode == '--run-complete' or \
+                calculation_mode == '--run-scaling':
+            from .scaling_module import scaling_module
+            if not os.path.exists(job['path_nga_folder']):
+                os.makedirs(job['path_nga_folder'])
+            if not os.path.exists(job['path_esm_folder']):
+                os.makedirs(job['path_esm_folder'])
+            scaling_module(job['site_code'],
+                           job['probability_of_exceedance_num'],
+                           job['intensity_measures'], job['output_folder'],
+                           job['n_gm'], job['path_nga_folder'],
+                           job['path_esm_folder'], force, only,
+                           job['metrics_file'])
+    return
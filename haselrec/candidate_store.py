@@ -0,0 +1,174 @@
+# Copyright (C) 2020-2021 Elisa Zuccolo, Eucentre Foundation
+#
+# haselREC is free software: you can redistribute it and/or modify it
+# under the terms of the GNU Affero General Public License as published
+# by the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# haselREC is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with haselREC. If not, see <http://www.gnu.org/licenses/>.
+
+def rotd50_columns():
+    """
+    Returns the names of the columns of the database file with the RotD50
+    spectral accelerations, at the periods of the database (PGA, 0.01 s,
+    ..., 10 s).
+    """
+    return ['rotD50_pga', 'rotD50_T0_010', 'rotD50_T0_025', 'rotD50_T0_040',
+            'rotD50_T0_050', 'rotD50_T0_070', 'rotD50_T0_100',
+            'rotD50_T0_150', 'rotD50_T0_200', 'rotD50_T0_250',
+            'rotD50_T0_300', 'rotD50_T0_350', 'rotD50_T0_400',
+            'rotD50_T0_450', 'rotD50_T0_500', 'rotD50_T0_600',
+            'rotD50_T0_700', 'rotD50_T0_750', 'rotD50_T0_800',
+            'rotD50_T0_900', 'rotD50_T1_000', 'rotD50_T1_200',
+            'rotD50_T1_400', 'rotD50_T1_600', 'rotD50_T1_800',
+            'rotD50_T2_000', 'rotD50_T2_500', 'rotD50_T3_000',
+            'rotD50_T3_500', 'rotD50_T4_000', 'rotD50_T5_000',
+            'rotD50_T6_000', 'rotD50_T7_000', 'rotD50_T8_000',
+            'rotD50_T9_000', 'rotD50_T10_000']
+
+
+def create_spectra_store(database_path, spectra_store, block_size=100000):
+    """
+    Creates the store of the spectra of the database: a `.npy` file with the
+    RotD50 spectral accelerations (in g) of all the ground motions of the
+    database file (one row for each ground motion, in the same order, one
+    column for each period of the database).
+
+    The store is memory-mapped by :code:`screen_database`, so that very large
+    databases (e.g. libraries of millions of simulated ground motions, with
+    the same format of the database file) never need to be held in memory.
+    The database file is read in blocks of :code:`block_size` rows.
+
+    The store is written to a temporary file and then renamed, so that an
+    interrupted run never leaves a partial store. The hash of the database
+    file and the number of rows are recorded in `<spectra_store>.json`, to
+    check that the store matches the database (:code:`store_matches`).
+    """
+    import os
+    import json
+    import numpy as np
+    import pandas as pd
+    from .fingerprint import file_hash
+
+    columns = rotd50_columns()
+    n_rows = 0
+    for chunk in pd.read_csv(database_path, sep=';', engine='python',
+                             usecols=['source'], chunksize=block_size):
+        n_rows += len(chunk)
+
+    temporary = spectra_store + '.tmp.npy'
+    store = np.lib.format.open_memmap(temporary, mode='w+', dtype=float,
+                                      shape=(n_rows, len(columns)))
+    start = 0
+    for chunk in pd.read_csv(database_path, sep=';', engine='python',
+                             usecols=['source'] + columns,
+                             chunksize=block_size):
+        sa = chunk[columns].to_numpy(dtype=float)
+        esm = (chunk['source'] == 'ESM').to_numpy()
+        sa[esm] = sa[esm] / 981  # in g
+        store[start:start + len(chunk)] = sa
+        start += len(chunk)
+    store.flush()
+    del store
+    with open(spectra_store + '.json.tmp', 'w') as f:
+        json.dump({'database': file_hash(database_path), 'rows': n_rows}, f)
+    os.replace(temporary, spectra_store)
+    os.replace(spectra_store + '.json.tmp', spectra_store + '.json')
+    print(['Number of spectra in the store = ', n_rows])
+    return
+
+
+def store_matches(database_path, spectra_store):
+    """
+    Returns True if the :code:`spectra_store` exists and was created from
+    the current content of the database file (hash recorded by
+    :code:`create_spectra_store`).
+    """
+    import os
+    import json
+    from .fingerprint import file_hash
+
+    if not os.path.isfile(spectra_store) or \
+            not os.path.isfile(spectra_store + '.json'):
+        return False
+    try:
+        with open(spectra_store + '.json') as f:
+            recorded = json.load(f)
+    except (OSError, ValueError):
+        return False
+    return recorded.get('database') == file_hash(database_path)
+
+
+def prepare_spectra_store(database_path, spectra_store):
+    """
+    Creates the :code:`spectra_store`, if it does not exist, or creates it
+    again if it does not match the database file (:code:`store_matches`).
+    """
+    import os
+
+    if store_matches(database_path, spectra_store):
+        return
+    if os.path.isfile(spectra_store):
+        print('Warning: the spectra store ' + spectra_store + ' does not '
+              'match the database file and it is created again')
+    else:
+        print('Creating the spectra store ' + spectra_store)
+    create_spectra_store(database_path, spectra_store)
+
+
+def temporary_store(shape):
+    """
+    Returns a memory-mapped array of the given :code:`shape` backed by an
+    anonymous temporary file, which is deleted when the array is released.
+    """
+    import tempfile
+    import numpy as np
+
+    return np.memmap(tempfile.TemporaryFile(), dtype=float, mode='w+',
+                     shape=shape)
+
+
+def take_rows(sa, rows, block_size=None):
+    """
+    Returns the :code:`rows` of :code:`sa`. If :code:`sa` is memory-mapped,
+    the rows are copied in blocks of :code:`block_size` rows (default 100000)
+    to a temporary memory-mapped array, so that they are never all held in
+    memory.
+    """
+    import numpy as np
+
+    if not isinstance(sa, np.memmap):
+        return sa[rows]
+    if block_size is None:
+        block_size = 100000
+    rows = np.asarray(rows, dtype=int)
+    taken = temporary_store((len(rows),) + sa.shape[1:])
+    for start in np.arange(0, len(rows), block_size):
+        taken[start:start + block_size] = sa[rows[start:start + block_size]]
+    return taken
+
+
+def log_spectra(sa_known, ind_per, block_size=None):
+    """
+    Returns the log-spectra of the candidate ground motions :code:`sa_known`
+    at the periods :code:`ind_per`. If :code:`sa_known` is memory-mapped, the
+    log-spectra are computed in blocks of :code:`block_size` rows (default
+    100000) and stored in a temporary memory-mapped array.
+    """
+    import numpy as np
+
+    if not isinstance(sa_known, np.memmap):
+        return np.log(sa_known[:, ind_per])
+    if block_size is None:
+        block_size = 100000
+    sample_big = temporary_store((len(sa_known), len(ind_per)))
+    for start in np.arange(0, len(sa_known), block_size):
+        sample_big[start:start + block_size] = np.log(
+            sa_known[start:start + block_size][:, ind_per])
+    return sample_big
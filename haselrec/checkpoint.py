@@ -0,0 +1,81 @@
+# Copyright (C) 2020-2021 Elisa Zuccolo, Eucentre Foundation
+#
+# haselREC is free software: you can redistribute it and/or modify it
+# under the terms of the GNU Affero General Public License as published
+# by the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# haselREC is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with haselREC. If not, see <http://www.gnu.org/licenses/>.
+
+def save_checkpoint(checkpoint, **state):
+    """
+    Saves the state of an optimization to the file :code:`checkpoint`
+    (`.npz` format). The file is first written to a temporary file and then
+    renamed, so that an interruption never leaves a corrupted checkpoint.
+    """
+    import os
+    import numpy as np
+
+    temporary = checkpoint + '.tmp.npz'
+    np.savez(temporary, **state)
+    os.replace(temporary, checkpoint)
+
+
+def objective_key(**inputs):
+    """
+    Returns a hash of the inputs defining the objective of an optimization
+    (e.g. target spectrum, weights, penalty, scale factors of the
+    candidates, pinned records), saved in the checkpoint to check that it is
+    resumed for the same objective.
+    """
+    import hashlib
+    import numpy as np
+
+    digest = hashlib.sha256()
+    for key in sorted(inputs):
+        value = np.asarray(inputs[key])
+        digest.update(key.encode())
+        digest.update(str(value.dtype).encode())
+        digest.update(str(value.shape).encode())
+        digest.update(np.ascontiguousarray(value).tobytes())
+    return digest.hexdigest()
+
+
+def load_checkpoint(checkpoint, optimizer, objective):
+    """
+    Loads the state of an optimization from the file :code:`checkpoint`. It
+    returns None if the file does not exist or if it was saved by another
+    :code:`optimizer` or for another :code:`objective`
+    (:code:`objective_key`), e.g. after a change of the penalty or of the
+    optimizer of the case: the checkpoint is then ignored with a warning.
+    """
+    import os
+    import numpy as np
+
+    if checkpoint is None or not os.path.exists(checkpoint):
+        return None
+    with np.load(checkpoint) as data:
+        state = {key: data[key] for key in data.files}
+    if (str(state.get('optimizer')) != optimizer or
+            str(state.get('objective')) != objective):
+        print('Warning: the checkpoint ' + checkpoint + ' does not match '
+              'the current optimizer or objective and it is ignored')
+        return None
+    print('Resuming the optimization from ' + checkpoint)
+    return state
+
+
+def remove_checkpoint(checkpoint):
+    """
+    Removes the file :code:`checkpoint`, if it exists.
+    """
+    import os
+
+    if checkpoint is not None and os.path.exists(checkpoint):
+        os.remove(checkpoint)
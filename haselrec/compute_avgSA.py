@@ -20,6 +20,7 @@ def compute_rho_avgsa(per, avg_periods, sctx, rctx, dctx, stddvs_avgsa, bgmpe,
     # Import libraries
     from openquake.hazardlib import imt, const, gsim
     from .modified_akkar_correlation_model import ModifiedAkkarCorrelationModel
+    from .metrics import count
 
     sum_numeratore = 0
     for i1 in avg_periods:
@@ -32,6 +33,7 @@ def compute_rho_avgsa(per, avg_periods, sctx, rctx, dctx, stddvs_avgsa, bgmpe,
         s = [const.StdDev.TOTAL]
         mean1, std1 = bgmpe().get_mean_and_stddevs(sctx, rctx, dctx,
                                                    imt.SA(i1), s)
+        count('gmpe_calls')
         sum_numeratore = sum_numeratore + rho * std1[0]
 
     denominatore = len(avg_periods) * stddvs_avgsa
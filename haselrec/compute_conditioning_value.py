@@ -12,6 +12,9 @@
 #
 # You should have received a copy of the GNU Affero General Public License
 # along with haselREC. If not, see <http://www.gnu.org/licenses/>.
+# OpenQuake output files already read, by path and modification time
+_hazard_files = {}
+
 
 def compute_conditioning_value(rlz, intensity_measures, site, poe, num_disagg,
                                probability_of_exceedance, num_classical,
@@ -23,20 +26,17 @@ def compute_conditioning_value(rlz, intensity_measures, site, poe, num_disagg,
     condition the CS, along with the mean magnitude and distance from the
     disaggregation analysis.
     """
-    import pandas as pd
     import numpy as np
 
-    # Get the name of the disaggregation file to look in
-    disagg_results = 'rlz-' + str(rlz) + '-' + intensity_measures + '-sid-' + \
-                     str(site) + '-poe-' + str(poe) + '_Mag_Dist_' + \
-                     str(num_disagg) + '.csv'
+    # Get the names of the disaggregation file and of the hazard map
+    disagg_results, hazard_map = hazard_files(
+        rlz, intensity_measures, site, poe, num_disagg, num_classical,
+        path_results_disagg, path_results_classical)
 
     selected_column = intensity_measures + '-' + str(probability_of_exceedance)
-    file_with_oq_acc_value = 'hazard_map-mean_' + str(num_classical) + '.csv'
 
     # Retrieve disaggregation results
-    df = pd.read_csv(''.join([path_results_disagg, '/', disagg_results]),
-        skiprows=1)
+    df = read_hazard_file(disagg_results).copy()
     df['rate'] = -np.log(1 - df['poe']) / investigation_time
     df['rate_norm'] = df['rate'] / df['rate'].sum()
     # mode = df.sort_values(by='rate_norm', ascending=False)[0:1]
@@ -44,8 +44,7 @@ def compute_conditioning_value(rlz, intensity_measures, site, poe, num_disagg,
     mean_dist = np.sum(df['dist'] * df['rate_norm'])
 
     # Retrieve conditioning value
-    df = pd.read_csv(''.join(
-        [path_results_classical, '/', file_with_oq_acc_value]), skiprows=1)
+    df = read_hazard_file(hazard_map)
     output_oq = df[selected_column]
     im_star = output_oq[site]
 
@@ -53,3 +52,36 @@ def compute_conditioning_value(rlz, intensity_measures, site, poe, num_disagg,
     mag = mean_mag
 
     return im_star, dist, mag
+
+
+def hazard_files(rlz, intensity_measures, site, poe, num_disagg,
+                 num_classical, path_results_disagg, path_results_classical):
+    """
+    Returns the paths of the 2 OpenQuake output files read for a case: the
+    disaggregation results and the hazard map::
+
+        <path_results_disagg>/rlz-<rlz>-<IM>-sid-<site>-poe-<poe>_Mag_Dist_<num_disagg>.csv
+        <path_results_classical>/hazard_map-mean_<num_classical>.csv
+    """
+    disagg_results = (path_results_disagg + '/rlz-' + str(rlz) + '-' +
+                      intensity_measures + '-sid-' + str(site) + '-poe-' +
+                      str(poe) + '_Mag_Dist_' + str(num_disagg) + '.csv')
+    hazard_map = (path_results_classical + '/hazard_map-mean_' +
+                  str(num_classical) + '.csv')
+    return disagg_results, hazard_map
+
+
+def read_hazard_file(path):
+    """
+    Reads an OpenQuake output file ('.csv', with a header line). Each file is
+    read once per process, unless it is modified, so that the hazard map is
+    shared by all cases and the files of a batch of jobs
+    (:code:`batch_module`) are read once.
+    """
+    import os
+    import pandas as pd
+
+    key = (os.path.abspath(path), os.path.getmtime(path))
+    if key not in _hazard_files:
+        _hazard_files[key] = pd.read_csv(path, skiprows=1)
+    return _hazard_files[key]
@@ -31,6 +31,7 @@ def compute_cs(t_cs, bgmpe, sctx, rctx, dctx, im_type, t_star, rrup, mag,
     from openquake.hazardlib import imt, const, gsim
     from .compute_avgSA import compute_rho_avgsa
     from .modified_akkar_correlation_model import ModifiedAkkarCorrelationModel
+    from .metrics import count
 
     # Use the same periods as the available spectra to construct the
     # conditional spectrum
@@ -44,6 +45,8 @@ def compute_cs(t_cs, bgmpe, sctx, rctx, dctx, im_type, t_star, rrup, mag,
             (gmpe_name=gmpe_input, avg_periods=avg_periods, corr_func=corr_type)
         mu_im_cond, sigma_im_cond = mgmpe.get_mean_and_stddevs(sctx, rctx, dctx,
                                                                p, s)
+        # the GMM is called for each averaging period
+        count('gmpe_calls', len(avg_periods))
     else:
         if im_type == 'PGA':
             p = imt.PGA()
@@ -52,6 +55,7 @@ def compute_cs(t_cs, bgmpe, sctx, rctx, dctx, im_type, t_star, rrup, mag,
         s = [const.StdDev.TOTAL]
         mu_im_cond, sigma_im_cond = bgmpe().get_mean_and_stddevs(
             sctx, rctx, dctx, p, s)
+        count('gmpe_calls')
     sigma_im_cond = sigma_im_cond[0]
 
     if (bgmpe.DEFINED_FOR_INTENSITY_MEASURE_COMPONENT ==
@@ -86,6 +90,7 @@ def compute_cs(t_cs, bgmpe, sctx, rctx, dctx, im_type, t_star, rrup, mag,
             p = imt.SA(t_cs[i])
         s = [const.StdDev.TOTAL]
         mu0, sigma0 = bgmpe().get_mean_and_stddevs(sctx, rctx, dctx, p, s)
+        count('gmpe_calls')
 
         if (bgmpe.DEFINED_FOR_INTENSITY_MEASURE_COMPONENT ==
                 'Greater of two horizontal'):
@@ -0,0 +1,53 @@
+# Copyright (C) 2020-2021 Elisa Zuccolo, Eucentre Foundation
+#
+# haselREC is free software: you can redistribute it and/or modify it
+# under the terms of the GNU Affero General Public License as published
+# by the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# haselREC is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with haselREC. If not, see <http://www.gnu.org/licenses/>.
+
+def compute_ln_sa1(tgt_per, tstar, avg_periods, intensity_measures, mean_req):
+    """
+    Finds the conditioning period(s) :code:`id_sel` among the target periods
+    and computes the conditioning value :code:`ln_sa1` (logarithm of the
+    target spectral value, averaged over :code:`avg_periods` for `AvgSA`).
+    """
+    import numpy as np
+
+    id_sel = []
+    if intensity_measures == 'AvgSA':
+        id_sel_bool = np.isin(tgt_per, avg_periods)
+        for i in np.arange(len(tgt_per)):
+            if id_sel_bool[i]:
+                id_sel.append(i)
+        id_sel = np.array(id_sel)
+    else:
+        id_sel = np.where(tgt_per == tstar)
+    ln_sa1 = np.mean(mean_req[id_sel])
+    return id_sel, ln_sa1
+
+
+def compute_scale_factors(sample_big, id_sel, ln_sa1):
+    """
+    Computes, for each candidate ground motion, the scale factor required to
+    match the conditioning value :code:`ln_sa1` at the conditioning period(s)
+    :code:`id_sel`. Candidates with a null spectral value at the conditioning
+    period(s) get a scale factor of 1000000, so that they are always excluded
+    by the maximum allowable scale factor.
+    """
+    import numpy as np
+
+    n_big = len(sample_big)
+    rec_value = np.exp(
+        np.mean(np.reshape(sample_big[:, id_sel], (n_big, -1)), axis=1))
+    scale_fac = np.full(n_big, 1000000.)
+    nonzero = rec_value != 0
+    scale_fac[nonzero] = np.exp(ln_sa1) / rec_value[nonzero]
+    return scale_fac
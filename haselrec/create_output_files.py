@@ -17,13 +17,24 @@ def create_output_files(output_folder, name, im_star, mean_mag, mean_dist, n_gm,
                         rec_idx, source, event_id, station_code, event_mw,
                         acc_distance, station_vs30, station_ec8,
                         final_scale_factors, tgt_per, mean_req, stdevs,
-                        record_sequence_number_nga, event_mag):
+                        record_sequence_number_nga, event_mag, trace=None,
+                        starts=None):
     """
     Two `.txt` files are generated::
 
         1) <IM>-site_<num_site>-poe-<num_poe>_CS.txt
         2) <IM>-site_<num_site>-poe-<num_poe>_summary_selection.txt
 
+    When the :code:`trace` of the optimization is given, a third file is
+    generated::
+
+        3) <IM>-site_<num_site>-poe-<num_poe>_optimization_trace.txt
+
+    When the selection has been repeated for several random seeds
+    (:code:`starts`), a fourth file is generated::
+
+        4) <IM>-site_<num_site>-poe-<num_poe>_starts.txt
+
     where:
         - `<IM>` is the required intensity measure
         - `<num_site>` is the site number
@@ -69,14 +80,38 @@ def create_output_files(output_folder, name, im_star, mean_mag, mean_dist, n_gm,
             9 NGA-West2 - - 266 6.33 36.67 242.05 nan 4.86
             10 NGA-West2 - - 165 6.53 18.88 242.05 nan 2.22
 
+        3) the deviation of the selected set from the target after each loop
+           of optimization (loop 0 is the initial set), the number of ground
+           motions replaced and the computation time of the loop.
+           Example::
+
+            loop deviation replaced_records time(s)
+            0 1.234567 0 0.000
+            1 0.345678 6 0.012
+            2 0.301234 2 0.011
+            3 0.301234 0 0.011
+
+        4) the random seed and the final deviation of the selected set from
+           the target for each start. The retained set is the one with the
+           lowest deviation.
+           Example::
+
+            start random_seed deviation
+            1 333 0.301234
+            2 3424274504 0.287654
+            3 3791506301 0.312345
+
     """
+    import os
     import numpy as np
 
-    # Output results to a text file
+    # Output results to a text file (the files are written to temporary
+    # files and renamed, so that an interrupted run never leaves truncated
+    # files)
     blank = '-'
     name_summary = (output_folder + '/' + name + '/' + name +
                     "_summary_selection.txt")
-    with open(name_summary, "w") as f:
+    with open(name_summary + '.tmp', "w") as f:
         f.write(
             "{} {}\n".format('reference hazard value = ', im_star))
         f.write("{} {}\n".format('mean_mag_disag = ', mean_mag))
@@ -107,13 +142,36 @@ def create_output_files(output_folder, name, im_star, mean_mag, mean_dist, n_gm,
                         station_vs30[elemento],
                         station_ec8[elemento],
                         final_scale_factors[i]))
+    os.replace(name_summary + '.tmp', name_summary)
 
     # Output conditional spectrum to a text file
     name_cs = output_folder + '/' + name + '/' + name + "_CS.txt"
-    with open(name_cs, "w") as f:
+    with open(name_cs + '.tmp', "w") as f:
         f.write("Period(s) lnCS(g) standard_deviation\n")
         for i in np.arange(len(tgt_per)):
             f.write("{:6.2f}{:6.2f}{:6.2f} \n".format(tgt_per[i],
                                                       mean_req[i],
                                                       stdevs[i]))
+    os.replace(name_cs + '.tmp', name_cs)
+
+    # Output the trace of the optimization to a text file
+    if trace is not None:
+        name_trace = (output_folder + '/' + name + '/' + name +
+                      "_optimization_trace.txt")
+        with open(name_trace + '.tmp', "w") as f:
+            f.write("loop deviation replaced_records time(s)\n")
+            for loop, deviation, n_swaps, loop_time in trace:
+                f.write("{} {:.6f} {} {:.3f}\n".format(loop, deviation,
+                                                       n_swaps, loop_time))
+        os.replace(name_trace + '.tmp', name_trace)
+
+    # Output the deviation of each start to a text file
+    if starts is not None:
+        name_starts = (output_folder + '/' + name + '/' + name +
+                       "_starts.txt")
+        with open(name_starts + '.tmp', "w") as f:
+            f.write("start random_seed deviation\n")
+            for i, (seed, deviation) in enumerate(starts):
+                f.write("{} {} {:.6f}\n".format(i + 1, seed, deviation))
+        os.replace(name_starts + '.tmp', name_starts)
     return
@@ -15,68 +15,203 @@
 
 def find_ground_motion(tgt_per, tstar, avg_periods, intensity_measures, n_gm,
                        sa_known, ind_per, mean_req, n_big, simulated_spectra,
-                       maxsf):
+                       maxsf, matching='greedy', backend='numpy',
+                       initial_records=None, n_pinned=0, block_size=None):
     """
     Select ground motions from the database that individually match the
     statistically simulated spectra. From:
     Jayaram N, Lin T, Baker J. (2011) A Computationally Efficient Ground-Motion
     Selection Algorithm for Matching a Target Response Spectrum Mean and
     Variance. Earthq Spectra 2011;27:797-815. https://doi.org/10.1193/1.3608002.
+
+    Two matching methods are available (:code:`matching`):
+
+        - `greedy`: each simulated spectrum, in turn, is matched to the
+          most similar ground motion not already selected;
+        - `assignment`: simulated spectra and ground motions are matched by
+          solving a rectangular linear assignment problem (Hungarian
+          algorithm), which minimizes the total error of the set;
+        - `knn`: as `greedy`, but the most similar ground motions are
+          retrieved from a k-d tree built on the scaled log-spectra of the
+          ground motions with allowable scale factor, without computing the
+          full matrix of errors. Suited to very large databases.
+
+    With :code:`backend='numba'`, the `greedy` matching is performed by a
+    JIT-compiled kernel (:code:`jit_kernels` module), if Numba is installed.
+
+    The ground motions in :code:`initial_records` (e.g. selected for a
+    neighbouring case), rescaled to the conditioning value, are kept in the
+    first slots of the set if their scale factor is allowable. Only the
+    remaining slots are matched to the simulated spectra. The first
+    :code:`n_pinned` of them (e.g. the records of a selection to be extended)
+    must have an allowable scale factor.
+
+    When :code:`block_size` is given (`greedy` matching only), the candidate
+    ground motions are streamed in blocks of :code:`block_size` ground motions
+    and the scaled log-spectra are never stored: for each simulated spectrum,
+    the candidates with the lowest errors in each block are retained, which
+    always include the one selected by the `greedy` matching. If
+    :code:`sa_known` is memory-mapped, the returned log-spectra
+    :code:`sample_big` are memory-mapped too.
     """
+    import sys
     import numpy as np
+    from .compute_scale_factors import compute_ln_sa1, \
+        compute_scale_factors
+    from .jit_kernels import get_kernel
+    from .candidate_store import log_spectra
+    from .metrics import count
 
-    sample_big = np.log(sa_known[:, ind_per])
+    if block_size is not None and matching != 'greedy':
+        sys.exit('Error: only the greedy matching method is supported with '
+                 'candidate_block_size')
 
-    id_sel = []
-    if intensity_measures == 'AvgSA':
-        id_sel_bool = np.isin(tgt_per, avg_periods)
-        for i in np.arange(len(tgt_per)):
-            if id_sel_bool[i]:
-                id_sel.append(i)
-        id_sel = np.array(id_sel)
-    else:
-        id_sel = np.where(tgt_per == tstar)
-    ln_sa1 = np.mean(mean_req[id_sel])
+    sample_big = log_spectra(sa_known, ind_per, block_size)
+
+    id_sel, ln_sa1 = compute_ln_sa1(tgt_per, tstar, avg_periods,
+                                    intensity_measures, mean_req)
+
+    # Scale factors and scaled log-spectra do not depend on the simulated
+    # spectrum, so they are computed once for all candidates
+    scale_fac = compute_scale_factors(sample_big, id_sel, ln_sa1)
+    if block_size is None:
+        scaled_big = sample_big + np.log(scale_fac)[:, np.newaxis]
+    log_simulated = np.log(simulated_spectra)
+
+    # ground motions with allowable scale factor
+    allowed_bool = (scale_fac <= maxsf) & (scale_fac >= 1. / maxsf)
 
     rec_id = np.zeros(n_gm, dtype=int)
-    sample_small = []
-    im_scale_fac = np.ones(n_gm)
-    # Find database spectra most similar to each simulated spectrum
-    for i in np.arange(n_gm):  # for each simulated spectrum
-        err = np.zeros(n_big) * 1000000  # initialize error matrix
-        scale_fac = np.ones(n_big)  # initialize scale factors to 1
-        # compute scale factors and errors for each candidate
-        # ground motion
-        for j in np.arange(n_big):
-            rec_value = np.exp(
-                sum(sample_big[j, id_sel]) / len(id_sel))
-            # rec_value=rec_value[0]
-            if rec_value == 0:
-                scale_fac[j] = 1000000
-            else:
-                scale_fac[j] = np.exp(ln_sa1) / rec_value
-            err[j] = sum(
-                (np.log(
-                    np.exp(sample_big[j, :]) * scale_fac[j]) - np.log(
-                    simulated_spectra[i, :])) ** 2)
-
-        # exclude previously-selected ground motions
-        err[rec_id[0:i - 1]] = 1000000
-        # exclude ground motions requiring too large SF
-        err[scale_fac > maxsf] = 1000000
-        # exclude ground motions requiring too large SF
-        err[scale_fac < 1. / maxsf] = 1000000
-
-        # find minimum-error ground motion
-        rec_id[i] = np.argmin(err)
-        min_err = np.min(err)
-        assert (min_err < 1000), (
+    # Ground motions from a previous selection with allowable scale factor are
+    # placed in the first slots; the simulated spectra of the other slots are
+    # matched to the remaining ground motions
+    n_init = 0
+    if initial_records is not None:
+        if not np.all(allowed_bool[initial_records[0:n_pinned]]):
+            sys.exit('Error: the scale factor of some records of the '
+                     'selection to be extended is not allowable')
+        init = [r for r in initial_records if allowed_bool[r]][0:n_gm]
+        n_init = len(init)
+        rec_id[0:n_init] = init
+        allowed_bool[init] = False
+        print(['Number of ground motions from the previous selection = ',
+               n_init])
+    allowed = np.where(allowed_bool)[0]
+    n_new = n_gm - n_init
+    log_simulated = log_simulated[n_init:n_gm, :]
+
+    kernel = None
+    if matching == 'greedy' and block_size is None:
+        kernel = get_kernel('match_greedy', backend)
+    if n_new == 0:
+        pass
+    elif kernel is not None:
+        rec_id[n_init:n_gm], min_err = kernel(log_simulated, scaled_big,
+                                              allowed_bool)
+        assert (np.max(min_err) < 1000), (
             'Warning: problem with simulated spectrum. '
             'No good matches found')
-        im_scale_fac[i] = scale_fac[rec_id[i]]  # store scale factor
-        sample_small.append(
-            np.log(np.exp(sample_big[rec_id[i], :]) * scale_fac[
-                rec_id[i]]))  # store scaled log spectrum
+    elif block_size is not None:
+        # n_new lowest errors (and corresponding ground motions) of each
+        # simulated spectrum among the candidates streamed so far
+        best_err = np.zeros((n_new, 0))
+        best_idx = np.zeros((n_new, 0), dtype=int)
+        sq_simulated = np.sum(log_simulated ** 2, axis=1)[:, np.newaxis]
+        for start in np.arange(0, n_big, block_size):
+            stop = min(start + block_size, n_big)
+            scaled = sample_big[start:stop] + \
+                np.log(scale_fac[start:stop])[:, np.newaxis]
+            err = np.maximum(sq_simulated +
+                             np.sum(scaled ** 2, axis=1)[np.newaxis, :] -
+                             2 * np.dot(log_simulated, scaled.T), 0)
+            err[:, ~allowed_bool[start:stop]] = 1000000
+            err = np.hstack([best_err, err])
+            idx = np.hstack([best_idx, np.tile(np.arange(start, stop),
+                                               (n_new, 1))])
+            if err.shape[1] > n_new:
+                part = np.argpartition(err, n_new - 1, axis=1)[:, 0:n_new]
+                err = np.take_along_axis(err, part, axis=1)
+                idx = np.take_along_axis(idx, part, axis=1)
+            best_err, best_idx = err, idx
+
+        for i in np.arange(n_new):  # for each simulated spectrum
+            # minimum-error ground motion not previously selected (the first
+            # one in case of ties)
+            order = np.lexsort((best_idx[i, :], best_err[i, :]))
+            k = order[~np.isin(best_idx[i, order],
+                               rec_id[n_init:n_init + i])][0]
+            rec_id[n_init + i] = best_idx[i, k]
+            min_err = best_err[i, k]
+            assert (min_err < 1000), (
+                'Warning: problem with simulated spectrum. '
+                'No good matches found')
+    elif matching == 'knn':
+        from scipy.spatial import cKDTree
+
+        assert (len(allowed) >= n_new), (
+            'Warning: there are not enough ground motions with allowable '
+            'scale factor')
+        # index of the scaled log-spectra of the allowed ground motions; the
+        # n_new nearest neighbours of each simulated spectrum always contain
+        # at least one ground motion not already selected
+        tree = cKDTree(scaled_big[allowed])
+        dist, ind = tree.query(log_simulated, k=n_new)
+        dist = np.reshape(dist, (n_new, -1))
+        ind = np.reshape(ind, (n_new, -1))
+        for i in np.arange(n_new):  # for each simulated spectrum
+            # exclude previously-selected ground motions
+            k = np.where(~np.isin(allowed[ind[i, :]],
+                                  rec_id[n_init:n_init + i]))[0][0]
+            rec_id[n_init + i] = allowed[ind[i, k]]
+            min_err = dist[i, k] ** 2
+            assert (min_err < 1000), (
+                'Warning: problem with simulated spectrum. '
+                'No good matches found')
+    elif matching in ['greedy', 'assignment']:
+        # Squared errors between each simulated spectrum and each candidate
+        # ground motion, expanded as |a|^2 + |b|^2 - 2ab' (n_gm x n_big)
+        err = (np.sum(log_simulated ** 2, axis=1)[:, np.newaxis] +
+               np.sum(scaled_big ** 2, axis=1)[np.newaxis, :] -
+               2 * np.dot(log_simulated, scaled_big.T))
+        err = np.maximum(err, 0)
+        # exclude ground motions requiring too large or too small SF (and
+        # ground motions from a previous selection)
+        err[:, ~allowed_bool] = 1000000
+
+        if matching == 'assignment':
+            from scipy.optimize import linear_sum_assignment
+
+            # only ground motions with allowable scale factor are considered
+            assert (len(allowed) >= n_new), (
+                'Warning: there are not enough ground motions with allowable '
+                'scale factor')
+            row, col = linear_sum_assignment(err[:, allowed])
+            rec_id[n_init + row] = allowed[col]
+        else:
+            # Find database spectra most similar to each simulated spectrum
+            for i in np.arange(n_new):  # for each simulated spectrum
+                err_i = err[i, :].copy()
+                # exclude previously-selected ground motions
+                err_i[rec_id[n_init:n_init + i]] = 1000000
+
+                # find minimum-error ground motion
+                rec_id[n_init + i] = np.argmin(err_i)
+                min_err = err_i[rec_id[n_init + i]]
+                assert (min_err < 1000), (
+                    'Warning: problem with simulated spectrum. '
+                    'No good matches found')
+    else:
+        sys.exit('Error: matching method ' + str(matching) +
+                 ' is not supported')
+
+    # each simulated spectrum is compared with all candidates
+    count('n_big', n_big)
+    count('candidate_evaluations', n_gm * n_big)
+
+    im_scale_fac = scale_fac[rec_id]  # store scale factors
+    # store scaled log spectra
+    sample_small = sample_big[rec_id, :] + \
+        np.log(scale_fac[rec_id])[:, np.newaxis]
 
     return (sample_small, sample_big, id_sel, ln_sa1, rec_id,
             im_scale_fac)
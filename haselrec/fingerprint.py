@@ -0,0 +1,167 @@
+# Copyright (C) 2020-2021 Elisa Zuccolo, Eucentre Foundation
+#
+# haselREC is free software: you can redistribute it and/or modify it
+# under the terms of the GNU Affero General Public License as published
+# by the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# haselREC is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with haselREC. If not, see <http://www.gnu.org/licenses/>.
+
+"""
+Fingerprints of the cases (site, probability of exceedance and intensity
+measure), used to skip the cases whose outputs are up to date with the
+inputs.
+"""
+
+# hashes of the input files already read, by path, modification time and size
+_file_hashes = {}
+
+
+def file_hash(path):
+    """
+    Returns the SHA-256 hash of the file :code:`path` (None if it does not
+    exist). The hash is computed once per process, unless the file is
+    modified.
+    """
+    import os
+    import hashlib
+
+    if path is None or not os.path.isfile(path):
+        return None
+    status = os.stat(path)
+    key = (os.path.abspath(path), status.st_mtime_ns, status.st_size)
+    if key not in _file_hashes:
+        digest = hashlib.sha256()
+        with open(path, 'rb') as f:
+            for chunk in iter(lambda: f.read(1 << 20), b''):
+                digest.update(chunk)
+        _file_hashes[key] = digest.hexdigest()
+    return _file_hashes[key]
+
+
+def case_fingerprint(parameters, files):
+    """
+    Returns the fingerprint of a case: the SHA-256 hash of the haselREC
+    version, of the :code:`parameters` affecting the case (dictionary) and
+    of the hashes of the input :code:`files`.
+    """
+    import json
+    import hashlib
+    import numpy as np
+    from . import __version__
+
+    # arrays are converted to lists, whose representation is never
+    # abbreviated
+    content = {'version': __version__,
+               'parameters': {key: repr(np.asarray(value).tolist()
+                                        if isinstance(value, np.ndarray)
+                                        else value)
+                              for key, value in sorted(parameters.items())},
+               'files': [file_hash(path) for path in files]}
+    return hashlib.sha256(json.dumps(content).encode()).hexdigest()
+
+
+def fingerprint_file(output_folder, name, stage):
+    """
+    Returns the name of the file storing the fingerprint of the case
+    :code:`name` for the :code:`stage` (`selection` or `scaling`)::
+
+        <output_folder>/<name>/<name>_fingerprint_<stage>.json
+    """
+    return (output_folder + '/' + name + '/' + name + '_fingerprint_' +
+            stage + '.json')
+
+
+def up_to_date(output_folder, name, stage, fingerprint, outputs):
+    """
+    Checks if the outputs of the case :code:`name` for the :code:`stage` are
+    up to date: the fingerprint file must exist and match
+    :code:`fingerprint` and all files in :code:`outputs` must exist.
+
+    It returns the content of the fingerprint file (dictionary) if the case
+    is up to date, None otherwise.
+    """
+    import os
+    import json
+
+    path = fingerprint_file(output_folder, name, stage)
+    if not os.path.isfile(path):
+        return None
+    try:
+        with open(path) as f:
+            info = json.load(f)
+    except ValueError:
+        return None
+    if info.get('fingerprint') != fingerprint:
+        return None
+    if not all(os.path.isfile(output) for output in outputs):
+        return None
+    return info
+
+
+def write_fingerprint(output_folder, name, stage, fingerprint, **info):
+    """
+    Writes the fingerprint file of the case :code:`name` for the
+    :code:`stage`, along with additional :code:`info`. The file is first
+    written to a temporary file and then renamed.
+    """
+    import os
+    import json
+
+    path = fingerprint_file(output_folder, name, stage)
+    info['fingerprint'] = fingerprint
+    with open(path + '.tmp', 'w') as f:
+        json.dump(info, f, indent=1)
+    os.replace(path + '.tmp', path)
+
+
+def remove_fingerprint(output_folder, name, stage):
+    """
+    Removes the fingerprint file of the case :code:`name` for the
+    :code:`stage`, if it exists. It is called before computing the case, so
+    that interrupted outputs are never considered up to date.
+    """
+    import os
+
+    path = fingerprint_file(output_folder, name, stage)
+    if os.path.exists(path):
+        os.remove(path)
+
+
+def parse_only(text):
+    """
+    Parses the filter of the cases given with option :code:`--only`, e.g.
+    `site=1,poe=2,im=SA(0.2)` (a key can be repeated to give several
+    values). It returns a dictionary with the allowed values (strings) for
+    each key.
+    """
+    import re
+    import sys
+
+    only = {}
+    # commas inside parentheses belong to the intensity measure
+    for item in re.split(r',(?![^(]*\))', text):
+        key, _, value = item.partition('=')
+        key = key.strip()
+        if key not in ['site', 'poe', 'im'] or value.strip() == '':
+            sys.exit('Error: --only must be followed by site=...,poe=...,'
+                     'im=...')
+        only.setdefault(key, []).append(value.strip())
+    return only
+
+
+def case_selected(only, site, poe, im):
+    """
+    Checks if the case (:code:`site`, :code:`poe`, :code:`im`) passes the
+    filter :code:`only` (see :code:`parse_only`; None means all cases).
+    """
+    if only is None:
+        return True
+    values = {'site': str(site), 'poe': str(poe), 'im': str(im)}
+    return all(values[key] in only[key] for key in only)
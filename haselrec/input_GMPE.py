@@ -13,6 +13,10 @@
 # You should have received a copy of the GNU Affero General Public License
 # along with haselREC. If not, see <http://www.gnu.org/licenses/>.
 
+# GMM classes already found, by name
+_gmpes = {}
+
+
 def inizialize_gmm(index, gmpe_input, rjb, mag, z_hyp_input, dip_input, rake,
                    upper_sd_input, lower_sd_input, azimuth_input, fhw, vs30type,
                    vs30_input, z2pt5_input, z1pt0_input):
@@ -32,10 +36,12 @@ def inizialize_gmm(index, gmpe_input, rjb, mag, z_hyp_input, dip_input, rake,
     from openquake.hazardlib import gsim
     import numpy as np
 
-    bgmpe = None
-    for name_gmpe, gmpes in gsim.get_available_gsims().items():
-        if name_gmpe == gmpe_input:
-            bgmpe = gmpes
+    # the GMM class is looked up once per process
+    if gmpe_input not in _gmpes:
+        for name_gmpe, gmpes in gsim.get_available_gsims().items():
+            if name_gmpe == gmpe_input:
+                _gmpes[gmpe_input] = gmpes
+    bgmpe = _gmpes.get(gmpe_input)
     if bgmpe is None:
         sys.exit('The GMM is not found')
 
@@ -0,0 +1,112 @@
+# Copyright (C) 2020-2021 Elisa Zuccolo, Eucentre Foundation
+#
+# haselREC is free software: you can redistribute it and/or modify it
+# under the terms of the GNU Affero General Public License as published
+# by the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# haselREC is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with haselREC. If not, see <http://www.gnu.org/licenses/>.
+
+"""
+Optional JIT-compiled versions of the inner loops of
+:code:`find_ground_motion` (greedy matching) and
+:code:`optimize_ground_motion` (scoring of the candidates for a slot). They
+are compiled with Numba, when installed, if the `numba` backend is selected
+(ini key :code:`backend` or environment variable :code:`HASELREC_BACKEND`);
+otherwise the NumPy implementation is used.
+"""
+
+import numpy as np
+
+_compiled = {}
+
+
+def match_greedy(log_simulated, scaled_big, allowed):
+    """
+    Matches in turn each simulated spectrum to the most similar ground motion
+    with allowable scale factor not already selected. It returns the indices
+    of the selected ground motions and the corresponding squared errors.
+    """
+    n_gm, n_per = log_simulated.shape
+    n_big = scaled_big.shape[0]
+    rec_id = np.zeros(n_gm, dtype=np.int64)
+    min_err = np.zeros(n_gm)
+    used = np.zeros(n_big, dtype=np.bool_)
+    for i in range(n_gm):
+        best = np.inf
+        best_j = 0
+        for j in range(n_big):
+            if used[j] or not allowed[j]:
+                err = 1000000.
+            else:
+                err = 0.
+                for p in range(n_per):
+                    err += (scaled_big[j, p] - log_simulated[i, p]) ** 2
+            if err < best:
+                best = err
+                best_j = j
+        rec_id[i] = best_j
+        min_err[i] = best
+        used[best_j] = True
+    return rec_id, min_err
+
+
+def best_candidate(sum_dev, sum_sq, n_gm, dev_big, stdevs, weights,
+                   sum_exceed, n_exceed, penalty, not_allowed, excluded):
+    """
+    Scores each candidate ground motion added to a set of :code:`n_gm` - 1
+    ground motions (see :code:`score_candidates`) and returns the lowest
+    deviation and the corresponding candidate (the first one in case of
+    ties). Candidates flagged in :code:`excluded` are not considered.
+    """
+    n_big, n_per = dev_big.shape
+    best = np.inf
+    best_j = 0
+    for j in range(n_big):
+        if excluded[j]:
+            continue
+        err_mean = 0.
+        err_sig = 0.
+        for p in range(n_per):
+            dev_mean = (sum_dev[p] + dev_big[j, p]) / n_gm
+            var = (sum_sq[p] + dev_big[j, p] ** 2) / n_gm - dev_mean ** 2
+            if var < 0:
+                var = 0.
+            dev_sig = np.sqrt(var) - stdevs[p]
+            err_mean += dev_mean ** 2
+            err_sig += dev_sig ** 2
+        dev_total = weights[0] * err_mean + weights[1] * err_sig
+        if penalty != 0:
+            dev_total += (sum_exceed + n_exceed[j]) * penalty
+        if not_allowed[j]:
+            dev_total += 1000000.
+        if dev_total < best:
+            best = dev_total
+            best_j = j
+    return best, best_j
+
+
+def get_kernel(name, backend):
+    """
+    Returns the compiled kernel :code:`name` if :code:`backend` is `numba`
+    and Numba is installed, None otherwise (the caller then uses the NumPy
+    implementation).
+    """
+    if backend != 'numba':
+        return None
+    if name not in _compiled:
+        try:
+            import numba
+        except ImportError:
+            print('Warning: numba is not installed, the numpy backend is '
+                  'used')
+            _compiled[name] = None
+        else:
+            _compiled[name] = numba.njit(cache=True)(globals()[name])
+    return _compiled[name]
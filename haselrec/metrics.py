@@ -0,0 +1,132 @@
+# Copyright (C) 2020-2021 Elisa Zuccolo, Eucentre Foundation
+#
+# haselREC is free software: you can redistribute it and/or modify it
+# under the terms of the GNU Affero General Public License as published
+# by the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# haselREC is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with haselREC. If not, see <http://www.gnu.org/licenses/>.
+
+"""
+Instrumentation of the stages of the selection and of the scaling. When a
+metrics file is set (:code:`start_metrics`), each stage of each case
+(:code:`stage_metrics`) appends a record to the file (JSON lines) with:
+
+    - :code:`case`, :code:`stage`, :code:`pid`: name of the case, name of
+      the stage and process
+    - :code:`wall_time`, :code:`cpu_time`: wall-clock and CPU time (s)
+    - :code:`rss`: resident set size of the process at the end of the
+      stage (bytes, None where not available)
+    - :code:`max_rss`: maximum resident set size of the process so far
+      (bytes, None where not available)
+    - :code:`peak_memory`: only when Python runs with :code:`tracemalloc`
+      (e.g. :code:`python -X tracemalloc -m haselrec`), peak of the traced
+      memory during the stage (bytes, including the memory held before the
+      stage). Tracing is not started by haselREC, since it slows down the
+      whole process.
+    - the counters of the stage (:code:`count`), e.g. :code:`n_big`,
+      :code:`gmpe_calls`, :code:`candidate_evaluations`, :code:`swaps`,
+      :code:`cache_hits`
+    - :code:`error`: the exception that interrupted the stage, if any
+"""
+
+# metrics file and case of the following records, counters of the running
+# stage
+_state = {'file': None, 'case': None, 'counters': None}
+
+
+def start_metrics(metrics_file, case):
+    """
+    Sets the :code:`metrics_file` and the :code:`case` (name) of the
+    following records. Nothing is recorded when :code:`metrics_file` is
+    None.
+    """
+    _state['file'] = metrics_file
+    _state['case'] = case
+
+
+def stage_metrics(stage, **counters):
+    """
+    Context manager measuring the :code:`stage` and appending its record to
+    the metrics file. :code:`counters` are the initial counters of the
+    stage.
+    """
+    import contextlib
+
+    if _state['file'] is None:
+        return contextlib.nullcontext()
+    return _StageMetrics(stage, counters)
+
+
+def count(counter, n=1):
+    """
+    Adds :code:`n` to the :code:`counter` of the running stage, if any.
+    """
+    counters = _state['counters']
+    if counters is not None:
+        counters[counter] = counters.get(counter, 0) + int(n)
+
+
+class _StageMetrics:
+    """
+    Measures a stage (see :code:`stage_metrics`).
+    """
+
+    def __init__(self, stage, counters):
+        self.stage = stage
+        self.counters = counters
+
+    def __enter__(self):
+        import time
+        import tracemalloc
+
+        self.outer = _state['counters']
+        _state['counters'] = self.counters
+        if tracemalloc.is_tracing():
+            tracemalloc.reset_peak()
+        self.wall_time = time.perf_counter()
+        self.cpu_time = time.process_time()
+        return self.counters
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        import os
+        import sys
+        import json
+        import time
+        import tracemalloc
+
+        try:
+            import resource
+            max_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+            # kilobytes, except on macOS
+            if sys.platform != 'darwin':
+                max_rss = max_rss * 1024
+        except ImportError:
+            max_rss = None
+        try:
+            with open('/proc/self/statm') as f:
+                rss = int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+        except (OSError, ValueError, AttributeError):
+            rss = None
+        record = {'case': _state['case'], 'stage': self.stage,
+                  'pid': os.getpid(),
+                  'wall_time': time.perf_counter() - self.wall_time,
+                  'cpu_time': time.process_time() - self.cpu_time,
+                  'rss': rss, 'max_rss': max_rss}
+        if tracemalloc.is_tracing():
+            record['peak_memory'] = tracemalloc.get_traced_memory()[1]
+        record.update(self.counters)
+        if exc_type is not None:
+            record['error'] = exc_type.__name__
+        _state['counters'] = self.outer
+        # a single write per record, so that the records of several
+        # processes are not mixed
+        with open(_state['file'], 'a') as f:
+            f.write(json.dumps(record) + '\n')
+        return False
@@ -0,0 +1,163 @@
+# Copyright (C) 2020-2021 Elisa Zuccolo, Eucentre Foundation
+#
+# haselREC is free software: you can redistribute it and/or modify it
+# under the terms of the GNU Affero General Public License as published
+# by the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# haselREC is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with haselREC. If not, see <http://www.gnu.org/licenses/>.
+
+def milp_ground_motion(n_loop, n_gm, sample_small, n_big, id_sel, ln_sa1,
+                       maxsf, sample_big, tgt_per, mean_req, stdevs, weights,
+                       penalty, rec_id, im_scale_fac, max_time=None,
+                       n_pinned=0):
+    """
+    Alternative to :code:`optimize_ground_motion` for small sets of candidate
+    ground motions: the set of :code:`n_gm` ground motions is selected by
+    solving a mixed-integer linear program (:code:`scipy.optimize.milp`),
+    which is exact for the linearized deviation from the target.
+
+    A binary variable is assigned to each candidate ground motion with
+    allowable scale factor. The deviation of the set from the target is
+    linearized as follows:
+
+        - error in mean: weighted sum over the periods of the squared
+          differences between the mean scaled log-spectrum of the set and the
+          target mean spectrum;
+        - error in standard deviation: weighted sum over the periods of the
+          squared differences between the second moment of the set and the
+          target one (target variance plus square of the mean difference of
+          the current set), divided by 2 times the target standard deviation;
+        - penalty: :code:`penalty` times the number of periods at which the
+          selected spectra exceed the target mean plus 3 standard deviations.
+
+    The squared differences are approximated from below by their tangents at
+    a set of points (piecewise-linear approximation). The linearization is
+    iterated, updating the mean difference of the current set, for at most
+    :code:`n_loop` iterations or until a set is found again.
+
+    Each program is solved within the remaining time of :code:`max_time`
+    seconds (default 60): when the time is over, the best set found so far is
+    retained. The optimality gap of each program is printed. The
+    ground motions in the first :code:`n_pinned` slots of the initial set are
+    always selected.
+
+    It returns the set with the lowest (non-linearized) deviation among the
+    initial one and the solutions of the programs, and a trace with, for each
+    iteration, the deviation of the solution, the number of ground motions
+    changed and the computation time (iteration 0 is the initial set).
+    """
+    import time
+    import numpy as np
+    from scipy.optimize import milp, LinearConstraint, Bounds
+    from .score_candidates import prepare_candidates, score_set
+
+    if max_time is None:
+        max_time = 60.
+
+    rec_id = np.array(rec_id)
+    scale_fac, dev_big, not_allowed, n_exceed = \
+        prepare_candidates(sample_big, id_sel, ln_sa1, maxsf, mean_req,
+                           stdevs, penalty)
+    allowed = np.union1d(np.where(~not_allowed)[0], rec_id[0:n_pinned])
+    assert (len(allowed) >= n_gm), (
+        'Warning: there are not enough ground motions with allowable scale '
+        'factor')
+
+    def set_deviation(ids):
+        # deviation of the set of ground motions ids from the target
+        dev_small = dev_big[ids, :]
+        return score_set(np.sum(dev_small, axis=0),
+                         np.sum(dev_small ** 2, axis=0), n_gm, stdevs,
+                         weights) + np.sum(n_exceed[ids]) * penalty
+
+    n_cand = len(allowed)
+    n_per = len(mean_req)
+    dev = dev_big[allowed, :].T / n_gm
+    # scale of the errors in second moment (finite at conditioning periods)
+    sig_scale = 2 * np.maximum(stdevs, 1e-3)
+    mom = (dev_big[allowed, :] ** 2).T / n_gm / sig_scale[:, np.newaxis]
+    eye = np.eye(n_per)
+    zero = np.zeros((n_per, n_per))
+    # the squared errors are approximated from below by their tangents at
+    # these errors
+    points = np.array([0., 0.005, 0.01, 0.02, 0.05, 0.1, 0.2, 0.5, 1.])
+    points = np.concatenate([-points[:0:-1], points])
+    slopes = np.repeat(2 * points, n_per)[:, np.newaxis]
+
+    # variables: candidates (binary), errors in mean and in standard
+    # deviation (continuous, non-negative)
+    cost = np.concatenate([n_exceed[allowed] * penalty,
+                           np.full(n_per, weights[0]),
+                           np.full(n_per, weights[1])])
+    integrality = np.concatenate([np.ones(n_cand), np.zeros(2 * n_per)])
+    lower = np.zeros(n_cand + 2 * n_per)
+    lower[0:n_cand][np.isin(allowed, rec_id[0:n_pinned])] = 1
+    upper = np.concatenate([np.ones(n_cand), np.full(2 * n_per, np.inf)])
+    bounds = Bounds(lower, upper)
+    set_size = LinearConstraint(
+        np.concatenate([np.ones(n_cand), np.zeros(2 * n_per)]), n_gm, n_gm)
+    # squared error in mean >= tangents at points (t >= 2 a m - a^2)
+    mean_error = LinearConstraint(
+        np.hstack([-slopes * np.tile(dev, (len(points), 1)),
+                   np.tile(eye, (len(points), 1)),
+                   np.tile(zero, (len(points), 1))]),
+        np.repeat(-points ** 2, n_per), np.inf)
+    moments = np.hstack([-slopes * np.tile(mom, (len(points), 1)),
+                         np.tile(zero, (len(points), 1)),
+                         np.tile(eye, (len(points), 1))])
+
+    best = set_deviation(rec_id)
+    best_id = rec_id.copy()
+    trace = [(0, best, 0, 0.)]
+    start = time.time()
+    current = rec_id
+    solutions = [set(rec_id)]
+    for loop in range(n_loop):
+        loop_start = time.time()
+        options = {'time_limit': max(max_time - (time.time() - start), 0)}
+
+        # squared error in std >= tangents at points, the error in std being
+        # (second moment - target second moment) / (2 target std)
+        mean_diff = np.mean(dev_big[current, :], axis=0)
+        target = (stdevs ** 2 + mean_diff ** 2) / sig_scale
+        std_error = LinearConstraint(
+            moments, np.repeat(-points ** 2, n_per) -
+            slopes[:, 0] * np.tile(target, len(points)), np.inf)
+
+        res = milp(cost, integrality=integrality, bounds=bounds,
+                   constraints=[set_size, mean_error, std_error],
+                   options=options)
+        if res.x is None:
+            print('Warning: ' + res.message)
+            break
+        print(['MILP optimality gap = ', res.mip_gap])
+
+        selected = allowed[np.round(res.x[0:n_cand]) == 1]
+        # keep the ground motions of the current set in the same slots
+        new = np.setdiff1d(selected, current)
+        current = np.array(current)
+        current[~np.isin(current, selected)] = new
+        n_changed = len(new)
+        deviation = set_deviation(current)
+        trace.append((loop + 1, deviation, n_changed,
+                      time.time() - loop_start))
+        if deviation < best:
+            best = deviation
+            best_id = current.copy()
+        # Stop when the linearization does not change the set anymore
+        if set(current) in solutions or time.time() - start >= max_time:
+            break
+        solutions.append(set(current))
+
+    rec_id = best_id
+    im_scale_fac = scale_fac[rec_id]
+    sample_small = dev_big[rec_id, :] + mean_req
+    print(['Number of MILP iterations = ', len(trace) - 1])
+    return rec_id, im_scale_fac, sample_small, trace
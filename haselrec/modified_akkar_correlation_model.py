@@ -23,16 +23,25 @@
 # not consider the zero period
 
 import pathlib
+import functools
 
 from openquake.hazardlib.gsim.mgmpe.generic_gmpe_avgsa import BaseAvgSACorrelationModel
-from scipy.interpolate import interp1d
 
 this = pathlib.Path(__file__)
 
-coeff_table = []
-with open(this.parent / 'modified_akkar_coeff_table.csv') as f:
-    for row in f:
-        coeff_table.append([float(col) for col in row.split(',')])
+
+@functools.lru_cache(maxsize=None)
+def read_coeff_table():
+    """
+    Reads the table of the correlation coefficients (once, when the model is
+    first used).
+    """
+    coeff_table = []
+    with open(this.parent / 'modified_akkar_coeff_table.csv') as f:
+        for row in f:
+            coeff_table.append([float(col) for col in row.split(',')])
+    return coeff_table
+
 
 akkar_periods = [0.0,
            0.01, 0.02, 0.03, 0.04, 0.05, 0.075, 0.1, 0.11, 0.12, 0.13, 0.14,
@@ -55,7 +64,9 @@ class ModifiedAkkarCorrelationModel(BaseAvgSACorrelationModel):
         Constructs the correlation matrix by two-step linear interpolation
         from the correlation table
         """
-        irho = np.array(coeff_table)
+        from scipy.interpolate import interp1d
+
+        irho = np.array(read_coeff_table())
         iper = np.array(akkar_periods)
         if np.any(self.avg_periods < iper[0]) or\
                 np.any(self.avg_periods > iper[-1]):
@@ -80,7 +91,7 @@ class ModifiedAkkarCorrelationModel(BaseAvgSACorrelationModel):
             The predicted correlation coefficient.
         """
         periods = np.array(akkar_periods)
-        rho = np.array(coeff_table)
+        rho = np.array(read_coeff_table())
         if t1 < periods[0] or t1 > periods[-1]:
             raise ValueError("t1 %.3f is out of valid period range (%.3f to "
                              "%.3f" % (t1, periods[0], periods[-1]))
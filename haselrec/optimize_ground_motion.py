@@ -15,88 +15,264 @@
 
 def optimize_ground_motion(n_loop, n_gm, sample_small, n_big, id_sel, ln_sa1,
                              maxsf, sample_big, tgt_per, mean_req, stdevs,
-                             weights, penalty, rec_id, im_scale_fac):
+                             weights, penalty, rec_id, im_scale_fac,
+                             n_workers=1, backend='numpy', checkpoint=None,
+                             checkpoint_interval=60., n_pinned=0,
+                             block_size=None):
     """
     Executes incremental changes to the initially selected ground motion set to
     further optimize its fit to the target spectrum distribution. From:
     Jayaram N, Lin T, Baker J. (2011). A Computationally Efficient Ground-Motion
     Selection Algorithm for Matching a Target Response Spectrum Mean and
     Variance. Earthq Spectra 2011;27:797-815. https://doi.org/10.1193/1.3608002.
+
+    The sums and sums of squares of the selected set are updated at each
+    replacement, so that all candidates for a slot are scored at once
+    (:code:`score_candidates` module).
+
+    The optimization stops when a loop does not replace any ground motion, or
+    after :code:`n_loop` loops. For each loop, the deviation of the set from
+    the target, the number of replaced ground motions and the computation
+    time are returned in :code:`trace` (loop 0 is the initial set).
+
+    When :code:`n_workers` > 1, the candidates are scored in blocks on a pool
+    of :code:`n_workers` processes sharing the scaled log-spectra of the
+    candidates (:code:`score_candidates_parallel` module). The selected set
+    is the same as with a single process. Otherwise, with
+    :code:`backend='numba'`, the candidates are scored by a JIT-compiled
+    kernel (:code:`jit_kernels` module), if Numba is installed.
+
+    When a :code:`checkpoint` file is given, the state of the optimization
+    (selected records, scale factors, loop and slot, trace) is saved to it
+    every :code:`checkpoint_interval` seconds. If the optimization is
+    interrupted (SIGINT), the state is saved and the best set found so far is
+    returned; the checkpoint is then used to resume the optimization when the
+    function is called again for the same case, unless the objective
+    (target, weights, penalty, scale factors of the candidates, pinned
+    records) has changed. The checkpoint is removed when the optimization
+    ends.
+
+    The ground motions in the first :code:`n_pinned` slots of the set (e.g.
+    the records of a selection to be extended) are never replaced.
+
+    When :code:`block_size` is given, the scaled log-spectra of the candidates
+    are not stored: for each slot, the candidates are streamed in blocks of
+    :code:`block_size` ground motions from :code:`sample_big` (which can be
+    memory-mapped) and the best candidate of each block is retained. The
+    selected set is the same, but :code:`n_workers` and :code:`backend` are
+    not used.
     """
 
+    import time
     import numpy as np
+    from .score_candidates import prepare_candidates, score_candidates, \
+        score_set, candidate_deviations
+    from .jit_kernels import get_kernel
+    from .checkpoint import load_checkpoint, save_checkpoint, \
+        remove_checkpoint, objective_key
+    from .metrics import count
 
     sample_small = np.array(sample_small)
+    rec_id = np.array(rec_id)
     print(
         'Please wait...This algorithm takes a few minutes '
         'depending on the number of records to be selected')
 
-    for _ in np.arange(n_loop):
-        # consider replacing each ground motion in the selected set
-        for i in np.arange(n_gm):
-            min_dev = 100000
-
-            sample_small = np.delete(sample_small, i, 0)
-            rec_id = np.delete(rec_id, i)
-            scale_fac = np.ones(n_big)
-            min_id = []
-
-            # Try to add a new spectrum to the subset list
-            for j in np.arange(n_big):
-                rec_value = np.exp(
-                    sum(sample_big[j, id_sel]) / len(id_sel))
-                if rec_value == 0:
-                    scale_fac[j] = 1000000
-                else:
-                    scale_fac[j] = np.exp(ln_sa1) / rec_value
-                added1 = np.reshape(
-                    (sample_big[j, :] + np.log(scale_fac[j])),
-                    (1, len(tgt_per)))
-                sample_small = np.concatenate(
-                    (sample_small, added1))  # add candidate to set
-                # Compute deviations from target
-                dev_mean = np.mean(sample_small, axis=0) - mean_req
-                dev_sig = np.std(sample_small, axis=0) - stdevs
-                dev_total = weights[0] * sum(dev_mean ** 2) + weights[
-                    1] * sum(dev_sig ** 2)
-
-                # Penalize bad spectra
-                # (set penalty to zero if this is not required)
-                if penalty != 0:
-                    for m in np.arange(len(sample_small)):
-                        dev_total = dev_total + sum(
-                            np.absolute(
-                                np.exp(sample_small[m, :]) > np.exp(
-                                    mean_req + 3 * stdevs))) \
-                                   * penalty
-
-                if scale_fac[j] > maxsf or scale_fac[j] < 1. / maxsf:
-                    dev_total = dev_total + 1000000
-
-                # Should cause improvement and record should not
-                # be repeated
-                if dev_total < min_dev and not any(rec_id == j):
-                    min_id = np.zeros(1, dtype=int)
-                    min_id[0] = j
-                    min_dev = dev_total
-                end = len(sample_small)
-                sample_small = sample_small[0:end - 1, :]
-
-            # Add new element in the right slot
-            im_scale_fac[i] = scale_fac[min_id]
-            end = len(sample_small)
-            added2 = np.reshape(
-                (sample_big[min_id, :] + np.log(scale_fac[min_id])),
-                (1, len(tgt_per)))
-            if i > 0:
-                sample_small = np.concatenate((sample_small[0:i, :],
-                                               added2,
-                                               sample_small[i:end,
-                                               :]))
-                rec_id = np.concatenate(
-                    (rec_id[0:i], min_id, rec_id[i:end]))
+    # Scaled log-spectra of all candidates, expressed as differences from the
+    # target mean spectrum, and number of periods at which they exceed the
+    # target mean plus 3 standard deviations
+    scale_fac, dev_big, not_allowed, n_exceed = \
+        prepare_candidates(sample_big, id_sel, ln_sa1, maxsf, mean_req,
+                           stdevs, penalty, block_size)
+    if block_size is None:
+        block_size = n_big
+
+    def candidate_dev(rows):
+        # scaled log-spectra of the candidates minus the target mean
+        if dev_big is None:
+            return candidate_deviations(sample_big, scale_fac, mean_req, rows)
+        return dev_big[rows]
+
+    pool = None
+    shm = None
+    if n_workers > 1 and dev_big is not None:
+        from multiprocessing import Pool, shared_memory
+        from .score_candidates_parallel import init_worker, \
+            best_candidate_block
+
+        shm = shared_memory.SharedMemory(create=True, size=dev_big.nbytes)
+        np.ndarray(dev_big.shape, dtype=float, buffer=shm.buf)[:] = dev_big
+        pool = Pool(n_workers, initializer=init_worker,
+                    initargs=(shm.name, dev_big.shape, n_exceed,
+                              not_allowed))
+        blocks = np.linspace(0, n_big, n_workers + 1).astype(int)
+
+    kernel = None
+    if pool is None and dev_big is not None:
+        kernel = get_kernel('best_candidate', backend)
+
+    def best_candidate(sum_dev, sum_sq, sum_exceed, excluded):
+        # lowest deviation obtained adding a candidate to the set, and
+        # corresponding candidate (the first one in case of ties)
+        if pool is not None:
+            tasks = [(blocks[k], blocks[k + 1], sum_dev, sum_sq, sum_exceed,
+                      excluded, n_gm, stdevs, weights, penalty)
+                     for k in np.arange(n_workers)
+                     if blocks[k + 1] > blocks[k]]
+            return min(pool.map(best_candidate_block, tasks))
+        if kernel is not None:
+            excluded_mask = np.zeros(n_big, dtype=bool)
+            excluded_mask[excluded] = True
+            return kernel(sum_dev, sum_sq, n_gm, dev_big, stdevs, weights,
+                          sum_exceed, n_exceed, penalty, not_allowed,
+                          excluded_mask)
+
+        min_dev, min_id = np.inf, 0
+        for start in np.arange(0, n_big, block_size):
+            stop = min(start + block_size, n_big)
+            # Try to add each candidate to the subset list and compute
+            # deviations from target
+            dev_total = score_candidates(sum_dev, sum_sq, n_gm,
+                                         candidate_dev(slice(start, stop)),
+                                         stdevs, weights)
+
+            # Penalize bad spectra
+            # (set penalty to zero if this is not required)
+            if penalty != 0:
+                dev_total = dev_total + (sum_exceed +
+                                         n_exceed[start:stop]) * penalty
+
+            dev_total[not_allowed[start:stop]] = \
+                dev_total[not_allowed[start:stop]] + 1000000
+
+            # Should cause improvement and record should not be repeated
+            dev_total[excluded[(excluded >= start) & (excluded < stop)] -
+                      start] = np.inf
+            j = np.argmin(dev_total)
+            if dev_total[j] < min_dev:
+                min_dev, min_id = dev_total[j], start + j
+        return min_dev, min_id
+
+    def set_deviation(sum_dev, sum_sq, sum_exceed):
+        # deviation of the whole set
+        return score_set(sum_dev, sum_sq, n_gm, stdevs, weights) + \
+            sum_exceed * penalty
+
+    dev_small = sample_small - mean_req
+    trace = [(0, set_deviation(np.sum(dev_small, axis=0),
+                               np.sum(dev_small ** 2, axis=0),
+                               np.sum(n_exceed[rec_id])), 0, 0.)]
+    first_loop = 0
+    first_slot = 0
+    n_swaps = 0
+    loop_time = 0.
+
+    # Resume from the checkpoint of an interrupted optimization
+    objective = objective_key(
+        n_gm=n_gm, n_big=n_big, ln_sa1=ln_sa1, maxsf=maxsf,
+        mean_req=mean_req, stdevs=stdevs, weights=weights, penalty=penalty,
+        scale_factors=scale_fac, pinned=rec_id[:n_pinned])
+    state = load_checkpoint(checkpoint, 'greedy', objective)
+    if state is not None:
+        rec_id = state['rec_id']
+        sample_small = candidate_dev(rec_id) + mean_req
+        trace = [tuple(row) for row in state['trace']]
+        first_loop = int(state['loop'])
+        first_slot = int(state['slot'])
+        n_swaps = int(state['n_swaps'])
+        loop_time = float(state['loop_time'])
+        # the last loop saved did not improve the set
+        if first_loop > 0 and trace[-1][2] == 0:
+            first_loop = n_loop
+
+    def save():
+        # a loop whose row is already in the trace is complete, also if the
+        # interruption came before the loop counters were updated
+        if len(trace) - 1 > current_loop:
+            saved = (len(trace) - 1, 0, 0, 0.)
+        else:
+            saved = (current_loop, slot, n_swaps, time.time() - start)
+        save_checkpoint(checkpoint, rec_id=rec_id,
+                        scale_factors=scale_fac[rec_id], loop=saved[0],
+                        slot=saved[1], n_swaps=saved[2],
+                        loop_time=saved[3], trace=np.array(trace),
+                        optimizer='greedy', objective=objective)
+
+    current_loop = first_loop
+    slot = first_slot
+    start = time.time() - loop_time
+    last_save = time.time()
+    interrupted = False
+    try:
+        for loop in range(first_loop, n_loop):
+            current_loop = loop
+
+            # running sums and sums of squares over the selected set
+            dev_small = sample_small - mean_req
+            sum_dev = np.sum(dev_small, axis=0)
+            sum_sq = np.sum(dev_small ** 2, axis=0)
+            sum_exceed = np.sum(n_exceed[rec_id])
+
+            # consider replacing each ground motion in the selected set
+            for i in np.arange(max(first_slot, n_pinned), n_gm):
+                slot = i
+                if (checkpoint is not None and
+                        time.time() - last_save >= checkpoint_interval):
+                    save()
+                    last_save = time.time()
+
+                sum_dev = sum_dev - dev_small[i, :]
+                sum_sq = sum_sq - dev_small[i, :] ** 2
+                sum_exceed = sum_exceed - n_exceed[rec_id[i]]
+
+                min_dev, min_id = best_candidate(sum_dev, sum_sq, sum_exceed,
+                                                 np.delete(rec_id, i))
+                count('candidate_evaluations', n_big)
+
+                # Add new element in the right slot
+                if min_dev < 100000:
+                    if rec_id[i] != min_id:
+                        n_swaps += 1
+                    rec_id[i] = min_id
+                    dev_small[i, :] = candidate_dev(min_id)
+                    sample_small[i, :] = dev_small[i, :] + mean_req
+
+                sum_dev = sum_dev + dev_small[i, :]
+                sum_sq = sum_sq + dev_small[i, :] ** 2
+                sum_exceed = sum_exceed + n_exceed[rec_id[i]]
+
+            trace.append((loop + 1,
+                          set_deviation(sum_dev, sum_sq, sum_exceed),
+                          n_swaps, time.time() - start))
+            count('swaps', n_swaps)
+            first_slot = 0
+            current_loop = loop + 1
+            slot = 0
+            # Stop when the set is not improved anymore
+            if n_swaps == 0:
+                break
+            n_swaps = 0
+            start = time.time()
+    except KeyboardInterrupt:
+        # Save the state and return the best set found so far
+        interrupted = True
+        if checkpoint is not None:
+            save()
+            print('Optimization interrupted: state saved to ' + checkpoint)
+    finally:
+        if pool is not None:
+            if interrupted:
+                pool.terminate()
             else:
-                sample_small = np.concatenate(
-                    (added2, sample_small[i:end, :]))
-                rec_id = np.concatenate((min_id, rec_id[i:end]))
-    return rec_id, im_scale_fac, sample_small
+                pool.close()
+            pool.join()
+            shm.close()
+            shm.unlink()
+
+    if not interrupted:
+        remove_checkpoint(checkpoint)
+    im_scale_fac[:] = scale_fac[rec_id]
+    sample_small = candidate_dev(rec_id) + mean_req
+
+    print(['Number of optimization loops = ', len(trace) - 1])
+    return rec_id, im_scale_fac, sample_small, trace
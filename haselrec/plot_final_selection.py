@@ -45,9 +45,17 @@ def plot_final_selection(name, lbl, n_gm, t_cs, sample_small, mean_req, stdevs,
            spectrum (red lines).
     """
     # Import libraries
+    import os
     import numpy as np
     import matplotlib.pyplot as plt
 
+    def save_figure(suffix):
+        # the figure is written to a temporary file and renamed, so that an
+        # interrupted run never leaves a truncated file
+        figure = output_folder + '/' + name + '/' + name + suffix
+        plt.savefig(figure + '.tmp', format='pdf', bbox_inches='tight')
+        os.replace(figure + '.tmp', figure)
+
     meanrecorded = np.mean(np.exp(sample_small), axis=0)
     meanrecorded_p2sigma = np.percentile(np.exp(sample_small), 50 + 34.1 + 13.6,
                                          axis=0)
@@ -106,8 +114,7 @@ def plot_final_selection(name, lbl, n_gm, t_cs, sample_small, mean_req, stdevs,
     # plt.title('site '+str(number))
     plt.grid(True)
     plt.legend()
-    plt.savefig(output_folder + '/' + name + '/' + name + '_spectra_gms.pdf',
-                bbox_inches='tight')
+    save_figure('_spectra_gms.pdf')
     plt.close()
 
     # Spectra
@@ -130,8 +137,7 @@ def plot_final_selection(name, lbl, n_gm, t_cs, sample_small, mean_req, stdevs,
     plt.xscale('log')
     plt.grid(True)
     plt.legend()
-    plt.savefig(output_folder + '/' + name + '/' + name + '_spectra.pdf',
-                bbox_inches='tight')
+    save_figure('_spectra.pdf')
     plt.close()
 
     # Dispersion
@@ -147,6 +153,5 @@ def plot_final_selection(name, lbl, n_gm, t_cs, sample_small, mean_req, stdevs,
     plt.xscale('log')
     plt.grid(True)
     plt.legend()
-    plt.savefig(output_folder + '/' + name + '/' + name + '_dispersion.pdf',
-                bbox_inches='tight')
+    save_figure('_dispersion.pdf')
     plt.close()
@@ -0,0 +1,64 @@
+# Copyright (C) 2020-2021 Elisa Zuccolo, Eucentre Foundation
+#
+# haselREC is free software: you can redistribute it and/or modify it
+# under the terms of the GNU Affero General Public License as published
+# by the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# haselREC is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with haselREC. If not, see <http://www.gnu.org/licenses/>.
+
+def prune_candidates(tgt_per, tstar, avg_periods, intensity_measures, n_gm,
+                     sa_known, ind_per, mean_req, stdevs, maxsf, prune_sigma,
+                     prune_fraction, block_size=None):
+    """
+    Removes from the screened database the candidate ground motions that can
+    never be useful for the selection. After scaling to the conditioning
+    value, a candidate ground motion is removed if:
+
+        - its scale factor is larger than :code:`maxsf` or smaller than
+          1/:code:`maxsf`;
+        - its log-spectrum differs from the target mean spectrum by more than
+          :code:`prune_sigma` standard deviations at more than a fraction
+          :code:`prune_fraction` of the target periods.
+
+    It returns the indices (in :code:`sa_known`) of the retained ground
+    motions. When :code:`block_size` is given, the candidate ground motions
+    are processed in blocks of :code:`block_size` ground motions.
+    """
+    import numpy as np
+    from .compute_scale_factors import compute_ln_sa1, compute_scale_factors
+    from .metrics import count
+
+    id_sel, ln_sa1 = compute_ln_sa1(tgt_per, tstar, avg_periods,
+                                    intensity_measures, mean_req)
+    if block_size is None:
+        block_size = len(sa_known)
+
+    keep = []
+    for start in np.arange(0, len(sa_known), block_size):
+        sample_big = np.log(sa_known[start:start + block_size][:, ind_per])
+        scale_fac = compute_scale_factors(sample_big, id_sel, ln_sa1)
+        scaled_big = sample_big + np.log(scale_fac)[:, np.newaxis]
+
+        # fraction of target periods at which each scaled spectrum is too far
+        # from the target
+        far = np.abs(scaled_big - mean_req) > prune_sigma * stdevs
+        far_fraction = np.mean(far, axis=1)
+
+        keep.append(start + np.where(
+            (scale_fac <= maxsf) & (scale_fac >= 1. / maxsf) &
+            (far_fraction <= prune_fraction))[0])
+    keep = np.concatenate(keep)
+
+    print(['Number of pruned ground motions = ', len(sa_known) - len(keep)])
+    count('n_big', len(keep))
+    assert (len(keep) >= n_gm), \
+        'Warning: there are not enough allowable ground motions after pruning'
+
+    return keep
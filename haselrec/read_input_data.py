@@ -144,6 +144,13 @@ def read_input_data(fileini):
 
         - :code:`database_path`: path to the folder containing the strong motion
           database;
+        - :code:`spectra_store`: (optional) path to a `.npy` file storing the
+          spectra of the database, which is memory-mapped instead of reading
+          the spectra from the database file. It is created from the database
+          file if it does not exist or if it does not match the database file
+          (hash recorded in `<spectra_store>.json`). Suited to very large
+          databases (e.g. libraries of simulated ground motions, with the
+          same format of the database file);
         - :code:`allowed_database`: list of databases to consider for record
           selection. They can be ['NGA-West2' or 'ESM'];
         - :code:`allowed_depth`: upper and lower bound of allowable depths;
@@ -157,19 +164,96 @@ def read_input_data(fileini):
           (:code:`probability_of_exceedance`);
         - :code:`maxsf`: list of maximum allowable scale factor. They must be
           specified for each probability of exceedance (:code:`probability_of_exceedance`);
+        - :code:`prune_sigma`: (optional) if defined, candidate ground motions
+          whose scaled spectrum differs from the target mean spectrum by more
+          than :code:`prune_sigma` standard deviations at most periods, or
+          whose scale factor is not allowed, are removed before the selection;
+        - :code:`prune_fraction`: (optional) fraction of the target periods
+          above which a candidate ground motion is removed (default 0.5);
 
     **Selection Parameters - section**
 
         - :code:`nGM`: number of records to select;
         - :code:`nTrials`: number of iterations of the initial spectral
           simulation step to perform;
+        - :code:`trials_tolerance`: (optional) if defined, the number of
+          iterations of the initial spectral simulation step is adaptive:
+          batches of :code:`nTrials` iterations are performed until the best
+          deviation improves by less than :code:`trials_tolerance`;
+        - :code:`max_trials`: (optional) maximum number of iterations of the
+          adaptive spectral simulation step (default 100 * :code:`nTrials`);
+        - :code:`max_trials_time`: (optional) maximum time (in seconds) of the
+          adaptive spectral simulation step;
+        - :code:`matching_method`: (optional) method used to match the
+          simulated spectra to the database spectra. It can be [`greedy`,
+          `assignment` or `knn`] (default `greedy`);
         - :code:`weights`: {weight for error in mean, weight for error in
           standard deviation, weight for error in skewness};
-        - :code:`nLoop`: number of loops of optimization to perform;
+        - :code:`nLoop`: maximum number of loops of optimization to perform
+          (the optimization stops earlier when a loop does not improve the
+          set);
+        - :code:`optimizer`: (optional) optimization algorithm. It can be
+          [`greedy`, `annealing` or `milp`] (default `greedy`). `greedy`
+          replaces in turn each ground motion of the set with the best
+          candidate; `annealing` performs a simulated annealing over random
+          swaps; `milp` selects the set by mixed-integer linear programming
+          (suited to few hundreds of candidate ground motions), then refined
+          by `greedy`;
+        - :code:`milp_threshold`: (optional) the `milp` optimizer is used
+          for the cases with at most :code:`milp_threshold` candidate ground
+          motions (after screening and pruning), whatever the
+          :code:`optimizer`;
+        - :code:`max_evaluations`: (optional) maximum number of swaps evaluated
+          by the `annealing` optimizer (default :code:`nLoop` * 1000 *
+          :code:`nGM`);
+        - :code:`max_optimization_time`: (optional) maximum time (in seconds)
+          of the `annealing` optimizer (no limit by default) and of the
+          `milp` optimizer (time limit of the mixed-integer programs, 60 by
+          default, also when the `milp` optimizer is selected by
+          :code:`milp_threshold`);
+        - :code:`checkpoint_interval`: (optional) interval (in seconds)
+          between two saves of the state of the optimization, used to resume
+          it if the run is interrupted (default 60);
+        - :code:`backend`: (optional) implementation of the inner loops of the
+          `greedy` matching and of the `greedy` optimizer. It can be
+          [`numpy` or `numba`]. `numba` requires Numba to be installed,
+          otherwise `numpy` is used. If not defined, the environment variable
+          :code:`HASELREC_BACKEND` is used (default `numpy`);
+        - :code:`optimization_workers`: (optional) number of processes used
+          to score the candidate ground motions during the optimization
+          (default 1). Useful only for very large databases;
+        - :code:`candidate_block_size`: (optional) number of candidate ground
+          motions processed at once during pruning, matching and
+          optimization. When defined, the candidate spectra are streamed in
+          blocks and their scaled versions are never stored, so that memory
+          use does not depend on the size of the database (default 100000
+          if :code:`spectra_store` is defined, otherwise all candidates are
+          processed at once). Only the `greedy` matching method is
+          supported;
         - :code:`penalty`: >0 to penalize selected spectra more than 3 sigma
           from the target at any period, =0 otherwise;
         - :code:`random_seed`: random seed number to simulate response spectra
           for initial matching;
+        - :code:`warm_start`: (optional) =1 to start the selection of each
+          case from the records selected for the previous probability of
+          exceedance at the same site and for the same intensity measure,
+          =0 otherwise (default 0);
+        - :code:`extend_selection`: (optional) =1 to extend the existing
+          selection of each case (summary file in the output folder) to
+          :code:`nGM` records, keeping the records already selected, =0
+          otherwise (default 0);
+        - :code:`n_starts`: (optional) number of random seeds for which the
+          selection is repeated, in parallel, retaining the best set
+          (default 1). The first seed is :code:`random_seed`;
+        - :code:`stage_cache`: (optional) =1 to cache the outputs of the
+          stages of the selection (conditioning value, screening, target
+          spectrum, pruning, simulation, matching and optimization) in the
+          folder `.cache` of the output folder, so that a rerun computes
+          again only the stages affected by the changed inputs, =0 otherwise
+          (default 0);
+        - :code:`metrics_file`: (optional) path of a JSON-lines file to
+          which the wall time, the CPU time, the memory and the counters
+          of each stage of each case are appended (default none);
 
     **Accelerogram Folders - section**
 
@@ -181,6 +265,7 @@ def read_input_data(fileini):
         - :code:`output_folder`: path to the output folder.
     """
 
+    import os
     import sys
     import numpy as np
 
@@ -326,6 +411,12 @@ def read_input_data(fileini):
 
     # Database parameters for screening recordings
     database_path = input['database_path']
+    # memory-mapped store of the spectra of the database
+    spectra_store = None
+    try:
+        spectra_store = input['spectra_store']
+    except KeyError:
+        pass
     allowed_database = [x.strip() for x in
                         input['allowed_database'].strip('{}').split(',')]
 
@@ -382,6 +473,18 @@ def read_input_data(fileini):
                 'Error: radius_mag must be of the same size of '
                 'probability_of_exceedance')
 
+    # Pruning of the candidate ground motions after the computation of the CS
+    prune_sigma = None
+    try:
+        prune_sigma = float(input['prune_sigma'])
+    except KeyError:
+        pass
+    prune_fraction = 0.5
+    try:
+        prune_fraction = float(input['prune_fraction'])
+    except KeyError:
+        pass
+
     # upper and lower bound of allowable depth values
     allowed_depth = [x.strip() for x in
                      input['allowed_depth'].strip('[]').split(
@@ -393,8 +496,65 @@ def read_input_data(fileini):
     # search the database spectra most similar to each simulated spectrum
     n_gm = int(input['nGM'])
     random_seed = int(input['random_seed'])
+    # start each case from the records selected for the previous poe
+    warm_start = False
+    try:
+        warm_start = bool(int(input['warm_start']))
+    except KeyError:
+        pass
+    # cache the outputs of the stages of the selection
+    stage_cache = False
+    try:
+        stage_cache = bool(int(input['stage_cache']))
+    except KeyError:
+        pass
+    # file of the metrics of the stages
+    metrics_file = None
+    try:
+        metrics_file = input['metrics_file']
+    except KeyError:
+        pass
+    # extend the existing selection of each case to nGM records
+    extend_selection = False
+    try:
+        extend_selection = bool(int(input['extend_selection']))
+    except KeyError:
+        pass
+    # number of random seeds for which the selection is repeated
+    n_starts = 1
+    try:
+        n_starts = int(input['n_starts'])
+    except KeyError:
+        pass
     # number of iterations of the initial spectral simulation step to perform
     n_trials = int(input['nTrials'])
+    # Adaptive number of iterations: batches of n_trials iterations are
+    # performed until the best deviation stops improving by more than
+    # trials_tol, or until the trial or time budget is reached
+    trials_tol = None
+    try:
+        trials_tol = float(input['trials_tolerance'])
+    except KeyError:
+        pass
+    max_trials = None
+    try:
+        max_trials = int(input['max_trials'])
+    except KeyError:
+        pass
+    max_trials_time = None
+    try:
+        max_trials_time = float(input['max_trials_time'])
+    except KeyError:
+        pass
+    # greedy, assignment or knn
+    matching = 'greedy'
+    try:
+        matching = input['matching_method']
+        if matching not in ['greedy', 'assignment', 'knn']:
+            sys.exit('Error: matching_method must be greedy, assignment or '
+                     'knn')
+    except KeyError:
+        pass
     # [Weights for error in mean, standard deviation and skewness] Used to find
     # the simulated spectra that best match the target from the statistically
     # simulated response spectra
@@ -407,6 +567,57 @@ def read_input_data(fileini):
     # >0 to penalize selected spectra moire than 3 sigma from the target at any
     # period, =0 otherwise.
     penalty = float(input['penalty'])
+    # greedy or annealing
+    optimizer = 'greedy'
+    try:
+        optimizer = input['optimizer']
+        if optimizer not in ['greedy', 'annealing', 'milp']:
+            sys.exit('Error: optimizer must be greedy, annealing or milp')
+    except KeyError:
+        pass
+    # budget of the annealing optimizer
+    max_evaluations = None
+    try:
+        max_evaluations = int(input['max_evaluations'])
+    except KeyError:
+        pass
+    max_optimization_time = None
+    try:
+        max_optimization_time = float(input['max_optimization_time'])
+    except KeyError:
+        pass
+    # interval (in seconds) between two checkpoints of the optimization
+    checkpoint_interval = 60.
+    try:
+        checkpoint_interval = float(input['checkpoint_interval'])
+    except KeyError:
+        pass
+    # numpy or numba (JIT-compiled inner loops)
+    backend = os.environ.get('HASELREC_BACKEND', 'numpy')
+    try:
+        backend = input['backend']
+    except KeyError:
+        pass
+    if backend not in ['numpy', 'numba']:
+        sys.exit('Error: backend must be numpy or numba')
+    # optimizer automatically set to milp for small sets of candidates
+    milp_threshold = None
+    try:
+        milp_threshold = int(input['milp_threshold'])
+    except KeyError:
+        pass
+    # number of candidate ground motions processed at once
+    block_size = None
+    try:
+        block_size = int(input['candidate_block_size'])
+    except KeyError:
+        pass
+    # number of processes used to score the candidates during the optimization
+    n_workers = 1
+    try:
+        n_workers = int(input['optimization_workers'])
+    except KeyError:
+        pass
 
     # Accelerogram folders
     path_nga_folder = input['path_NGA_folder']# NGA recordings have to be stored
@@ -425,4 +636,8 @@ def read_input_data(fileini):
             allowed_ec8_code, maxsf_input, radius_dist_input,
             radius_mag_input, allowed_depth, n_gm, random_seed, n_trials,
             weights, n_loop, penalty, path_nga_folder, path_esm_folder,
-            output_folder)
+            output_folder, trials_tol, max_trials, max_trials_time, matching,
+            prune_sigma, prune_fraction, n_workers, optimizer,
+            max_evaluations, max_optimization_time, n_starts, backend,
+            warm_start, checkpoint_interval, extend_selection, spectra_store,
+            block_size, milp_threshold, stage_cache, metrics_file)
@@ -0,0 +1,68 @@
+# Copyright (C) 2020-2021 Elisa Zuccolo, Eucentre Foundation
+#
+# haselREC is free software: you can redistribute it and/or modify it
+# under the terms of the GNU Affero General Public License as published
+# by the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# haselREC is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with haselREC. If not, see <http://www.gnu.org/licenses/>.
+
+def read_previous_selection(output_folder, name, n_gm, allowed_index, source,
+                            event_id, station_code, record_sequence_number_nga):
+    """
+    Reads the summary file of an existing selection
+    (`<name>_summary_selection.txt`, created by :code:`create_output_files`)
+    and identifies its records among the screened candidate ground motions.
+
+    It is used to extend an existing selection to a larger number of records
+    :code:`n_gm`: the records of the existing selection are kept, in the same
+    order, and only the additional ones are selected.
+
+    It returns the indices (in the database) of the records of the existing
+    selection.
+    """
+    import os
+    import sys
+    import pandas as pd
+
+    name_summary = (output_folder + '/' + name + '/' + name +
+                    "_summary_selection.txt")
+    if not os.path.isfile(name_summary):
+        sys.exit('Error: the selection to be extended does not exist: ' +
+                 name_summary)
+    # (read as strings, so that the ESM codes keep their leading zeros)
+    summary = pd.read_csv(name_summary, sep=' ', skiprows=3, dtype=str)
+    if len(summary) >= n_gm:
+        sys.exit('Error: nGM must be larger than the number of records of '
+                 'the selection to be extended (' + str(len(summary)) + ')')
+
+    # Identify the candidate ground motions by event ID and station code
+    # (ESM) or by recording ID (NGA-West2)
+    candidates = {}
+    for i in allowed_index:
+        if source[i] == 'ESM':
+            candidates[('ESM', str(event_id[i]), str(station_code[i]))] = i
+        if source[i] == 'NGA-West2':
+            candidates[('NGA-West2',
+                        int(record_sequence_number_nga[i]))] = i
+
+    rec_idx = []
+    for i in range(len(summary)):
+        if summary.source[i] == 'ESM':
+            key = ('ESM', str(summary.event_id_ESM[i]),
+                   str(summary.station_code_ESM[i]))
+        else:
+            key = ('NGA-West2', int(float(summary.recID_NGA[i])))
+        if key not in candidates:
+            sys.exit('Error: record ' + str(i + 1) + ' of ' + name_summary +
+                     ' is not among the candidate ground motions')
+        rec_idx.append(candidates[key])
+    print(['Number of records of the selection to be extended = ',
+           len(rec_idx)])
+    return rec_idx
@@ -15,7 +15,8 @@
 
 def scaling_module(site_code, probability_of_exceedance_num,
                    intensity_measures, output_folder, n_gm,
-                   path_nga_folder, path_esm_folder):
+                   path_nga_folder, path_esm_folder, force=False,
+                   only=None, metrics_file=None):
 
     """
     This module is called when mode :code:`--run-scaling` is specified.
@@ -24,11 +25,23 @@ def scaling_module(site_code, probability_of_exceedance_num,
     in input the summary file created by mode :code:`--run-selection`
 
     Scaled recorded accelerograms are created by :code:`scale_acc` module.
+
+    The cases whose scaled accelerograms are up to date with the summary
+    file, the record files it lists and the other inputs (fingerprint
+    computed by :code:`fingerprint` module) are skipped, unless
+    :code:`force` is True. Only the cases passing the filter :code:`only`
+    (see :code:`parse_only`) are processed.
+
+    When :code:`metrics_file` is defined, the time and the memory of
+    the scaling of each case are appended to it (:code:`metrics` module).
     """
 
     import numpy as np
     import pandas as pd
     from .scale_acc import scale_acc
+    from .fingerprint import case_fingerprint, up_to_date, \
+        write_fingerprint, remove_fingerprint, case_selected
+    from .metrics import start_metrics, stage_metrics
 
     for ii in np.arange(len(site_code)):
         site = site_code[ii]
@@ -38,12 +51,58 @@ def scaling_module(site_code, probability_of_exceedance_num,
                 name = intensity_measures[im] + '-site_' + str(
                     site) + '-poe-' + str(poe)
 
+                if not case_selected(only, site, poe, intensity_measures[im]):
+                    continue
+
                 name_summary = (output_folder + '/' + name + '/' + name +
                                 "_summary_selection.txt")
 
+                # Skip the case if its outputs are up to date
                 summary = pd.read_csv(name_summary, sep=' ', skiprows=3)
-                scale_acc(n_gm, summary.recID_NGA, path_nga_folder,
-                          path_esm_folder, summary.source,
-                          summary.event_id_ESM, summary.station_code_ESM, name,
-                          output_folder, summary.scale_factor)
+                fingerprint = case_fingerprint(
+                    {'n_gm': n_gm, 'path_nga_folder': path_nga_folder,
+                     'path_esm_folder': path_esm_folder},
+                    [name_summary] + _record_files(summary, n_gm,
+                                                   path_nga_folder,
+                                                   path_esm_folder))
+                outputs = [output_folder + '/' + name +
+                           '/GMR_time_scaled_acc_' + str(i + 1) + '_' +
+                           str(comp) + '.txt' for i in range(n_gm)
+                           for comp in [1, 2]]
+                if not force and up_to_date(output_folder, name, 'scaling',
+                                            fingerprint, outputs):
+                    print('Skipping ' + name + ' (up to date)')
+                    continue
+                remove_fingerprint(output_folder, name, 'scaling')
+
+                start_metrics(metrics_file, name)
+                with stage_metrics('scaling'):
+                    scale_acc(n_gm, summary.recID_NGA, path_nga_folder,
+                              path_esm_folder, summary.source,
+                              summary.event_id_ESM, summary.station_code_ESM,
+                              name, output_folder, summary.scale_factor)
+                write_fingerprint(output_folder, name, 'scaling',
+                                  fingerprint)
     return
+
+
+def _record_files(summary, n_gm, path_nga_folder, path_esm_folder):
+    """
+    Returns the record files read by :code:`scale_acc` for the first
+    :code:`n_gm` records of the :code:`summary` of a selection: the 2
+    horizontal components of the NGA-West2 records and the files of the
+    folders of the ESM records (none if the folder is not downloaded yet).
+    """
+    import glob
+
+    files = []
+    for i in range(n_gm):
+        if summary.source[i] == 'NGA-West2':
+            files.extend(path_nga_folder + '/RSN' +
+                         str(int(summary.recID_NGA[i])) + '_' + str(comp) +
+                         '.AT2' for comp in [1, 2])
+        elif summary.source[i] == 'ESM':
+            files.extend(sorted(glob.glob(
+                path_esm_folder + '/' + summary.event_id_ESM[i] + '-' +
+                summary.station_code_ESM[i] + '/*')))
+    return files
@@ -0,0 +1,95 @@
+# Copyright (C) 2020-2021 Elisa Zuccolo, Eucentre Foundation
+#
+# haselREC is free software: you can redistribute it and/or modify it
+# under the terms of the GNU Affero General Public License as published
+# by the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# haselREC is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with haselREC. If not, see <http://www.gnu.org/licenses/>.
+
+def prepare_candidates(sample_big, id_sel, ln_sa1, maxsf, mean_req, stdevs,
+                       penalty, block_size=None):
+    """
+    Computes the quantities of the candidate ground motions that do not change
+    during the optimization of the selected set: scale factors, scaled
+    log-spectra expressed as differences from the target mean spectrum,
+    candidates with a scale factor that is not allowed and, if
+    :code:`penalty` != 0, number of periods at which each scaled spectrum
+    exceeds the target mean plus 3 standard deviations.
+
+    When :code:`block_size` is given, the candidates are processed in blocks
+    of :code:`block_size` ground motions and the scaled log-spectra are not
+    stored (None is returned): they are computed block by block by
+    :code:`candidate_deviations` when needed.
+    """
+    import numpy as np
+    from .compute_scale_factors import compute_scale_factors
+
+    scale_fac = compute_scale_factors(sample_big, id_sel, ln_sa1)
+    not_allowed = (scale_fac > maxsf) | (scale_fac < 1. / maxsf)
+    n_exceed = np.zeros(len(sample_big), dtype=int)
+    if block_size is None:
+        dev_big = sample_big + np.log(scale_fac)[:, np.newaxis] - mean_req
+        if penalty != 0:
+            n_exceed = np.sum(dev_big > 3 * stdevs, axis=1)
+        return scale_fac, dev_big, not_allowed, n_exceed
+
+    if penalty != 0:
+        for start in np.arange(0, len(sample_big), block_size):
+            rows = slice(start, start + block_size)
+            n_exceed[rows] = np.sum(candidate_deviations(
+                sample_big, scale_fac, mean_req, rows) > 3 * stdevs, axis=1)
+    return scale_fac, None, not_allowed, n_exceed
+
+
+def candidate_deviations(sample_big, scale_fac, mean_req, rows):
+    """
+    Computes the scaled log-spectra of the candidate ground motions
+    :code:`rows` (index, array of indices or slice) expressed as differences
+    from the target mean spectrum.
+    """
+    import numpy as np
+
+    return sample_big[rows] + np.log(scale_fac[rows])[..., np.newaxis] - \
+        mean_req
+
+
+def score_set(sum_dev, sum_sq, n_gm, stdevs, weights):
+    """
+    Computes the deviation from the target spectrum distribution of a set of
+    :code:`n_gm` ground motions described by the sums (:code:`sum_dev`) and
+    the sums of squares (:code:`sum_sq`) of the differences between their
+    scaled log-spectra and the target mean spectrum.
+    """
+    import numpy as np
+
+    # adding a null candidate leaves the sums over the set unchanged
+    return score_candidates(sum_dev, sum_sq, n_gm,
+                            np.zeros((1, len(sum_dev))), stdevs, weights)[0]
+
+
+def score_candidates(sum_dev, sum_sq, n_gm, cand_dev, stdevs, weights):
+    """
+    Computes the deviation from the target spectrum distribution (weighted
+    errors in mean and standard deviation) of the sets obtained by adding each
+    candidate ground motion to a set of :code:`n_gm` - 1 ground motions.
+
+    The set is described by the sums (:code:`sum_dev`) and the sums of squares
+    (:code:`sum_sq`) over its ground motions of the differences between the
+    scaled log-spectra and the target mean spectrum. :code:`cand_dev`
+    contains the same differences for the candidate ground motions (one row
+    for each candidate), so that all candidates are scored at once.
+    """
+    import numpy as np
+
+    dev_mean = (sum_dev + cand_dev) / n_gm
+    var = (sum_sq + cand_dev ** 2) / n_gm - dev_mean ** 2
+    dev_sig = np.sqrt(np.maximum(var, 0)) - stdevs
+    return weights[0] * np.sum(dev_mean ** 2, axis=1) + weights[1] * np.sum(
+        dev_sig ** 2, axis=1)
@@ -0,0 +1,64 @@
+# Copyright (C) 2020-2021 Elisa Zuccolo, Eucentre Foundation
+#
+# haselREC is free software: you can redistribute it and/or modify it
+# under the terms of the GNU Affero General Public License as published
+# by the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# haselREC is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with haselREC. If not, see <http://www.gnu.org/licenses/>.
+
+"""
+Helpers to score the candidate ground motions of
+:code:`optimize_ground_motion` on a pool of processes. The scaled
+log-spectra of the candidates are shared between processes through
+:code:`multiprocessing.shared_memory`; each process scores a block of
+candidates and returns its best candidate.
+"""
+
+_shared = {}
+
+
+def init_worker(shm_name, shape, n_exceed, not_allowed):
+    """
+    Attaches a process of the pool to the shared matrix of the scaled
+    log-spectra of the candidates (differences from the target mean).
+    """
+    import numpy as np
+    from multiprocessing import shared_memory
+
+    shm = shared_memory.SharedMemory(name=shm_name)
+    _shared['shm'] = shm
+    _shared['dev_big'] = np.ndarray(shape, dtype=float, buffer=shm.buf)
+    _shared['n_exceed'] = n_exceed
+    _shared['not_allowed'] = not_allowed
+
+
+def best_candidate_block(args):
+    """
+    Scores the candidates from :code:`start` to :code:`stop` and returns the
+    lowest deviation and the index of the corresponding candidate (the first
+    one in case of ties). Candidates in :code:`excluded` are not considered.
+    """
+    import numpy as np
+    from .score_candidates import score_candidates
+
+    [start, stop, sum_dev, sum_sq, sum_exceed, excluded, n_gm, stdevs,
+     weights, penalty] = args
+    dev_total = score_candidates(sum_dev, sum_sq, n_gm,
+                                 _shared['dev_big'][start:stop], stdevs,
+                                 weights)
+    if penalty != 0:
+        dev_total = dev_total + (
+            sum_exceed + _shared['n_exceed'][start:stop]) * penalty
+    not_allowed = _shared['not_allowed'][start:stop]
+    dev_total[not_allowed] = dev_total[not_allowed] + 1000000
+    excluded = excluded[(excluded >= start) & (excluded < stop)]
+    dev_total[excluded - start] = np.inf
+    j = np.argmin(dev_total)
+    return dev_total[j], start + j
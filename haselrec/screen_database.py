@@ -16,7 +16,8 @@
 def screen_database(database_path, allowed_database, allowed_recs_vs30,
                     radius_dist, radius_mag, mean_dist, mean_mag,
                     allowed_ec8_code, target_periods, n_gm, allowed_depth,
-                    vs30):
+                    vs30, spectra_store=None, block_size=None,
+                    database=None):
     """
     Screen the database of candidate ground motion to select only appropriate
     ground motions. The screening criteria are:
@@ -39,10 +40,24 @@ def screen_database(database_path, allowed_database, allowed_recs_vs30,
           not specified;
         - range of allowed focal depths;
         - only free-field ground motions are retained.
+
+    The spectra are read from the database file or, if
+    :code:`spectra_store` is given, from the memory-mapped store created by
+    :code:`create_spectra_store` (:code:`candidate_store` module). In the
+    latter case, the spectra of the retained ground motions are copied, in
+    blocks of :code:`block_size` ground motions, to a temporary
+    memory-mapped array, so that they are never all held in memory. The run
+    stops if the store does not match the database file.
+
+    The database file is read by :code:`read_database`, unless it has already
+    been loaded (:code:`database`).
     """
     # Import libraries
+    import sys
     import numpy as np
     import pandas as pd
+    from .candidate_store import rotd50_columns, take_rows, store_matches
+    from .metrics import count
 
     known_per = np.array(
         [0, 0.01, 0.025, 0.04, 0.05, 0.07, 0.1, 0.15, 0.2, 0.25,
@@ -50,7 +65,9 @@ def screen_database(database_path, allowed_database, allowed_recs_vs30,
          1.0, 1.2, 1.4, 1.6, 1.8, 2, 2.5, 3, 3.5, 4, 5, 6, 7, 8,
          9, 10])
 
-    dbacc = pd.read_csv(database_path, sep=';', engine='python')
+    dbacc = database
+    if dbacc is None:
+        dbacc = read_database(database_path, spectra_store)
 
     event_id = dbacc['event_id']
     event_mw = dbacc['Mw']
@@ -102,35 +119,28 @@ def screen_database(database_path, allowed_database, allowed_recs_vs30,
     ind_per = np.unique(ind_per)
     rec_per = known_per[ind_per]
 
-    sa_list = []
+    # Spectra of the database, in g (ESM spectra are in cm/s2)
+    if spectra_store is None:
+        sa = dbacc[rotd50_columns()].to_numpy(dtype=float)
+        esm = (source == 'ESM').to_numpy()
+        sa[esm] = sa[esm] / 981
+        positive = np.all(sa > 0, axis=1)
+    else:
+        if block_size is None:
+            block_size = 100000
+        sa = np.load(spectra_store, mmap_mode='r')
+        if (sa.shape[0] != len(dbacc) or
+                not store_matches(database_path, spectra_store)):
+            sys.exit('Error: the spectra store ' + spectra_store + ' does not '
+                     'match the database file ' + database_path +
+                     ' (create it again with create_spectra_store)')
+        positive = np.concatenate(
+            [np.all(sa[start:start + block_size] > 0, axis=1)
+             for start in np.arange(0, len(sa), block_size)])
+
     allowed_index = []
     for i in np.arange(len(event_id)):
-        rotd50 = np.array([dbacc['rotD50_pga'][i], dbacc['rotD50_T0_010'][i],
-                           dbacc['rotD50_T0_025'][i], dbacc['rotD50_T0_040'][i],
-                           dbacc['rotD50_T0_050'][i], dbacc['rotD50_T0_070'][i],
-                           dbacc['rotD50_T0_100'][i], dbacc['rotD50_T0_150'][i],
-                           dbacc['rotD50_T0_200'][i], dbacc['rotD50_T0_250'][i],
-                           dbacc['rotD50_T0_300'][i], dbacc['rotD50_T0_350'][i],
-                           dbacc['rotD50_T0_400'][i], dbacc['rotD50_T0_450'][i],
-                           dbacc['rotD50_T0_500'][i], dbacc['rotD50_T0_600'][i],
-                           dbacc['rotD50_T0_700'][i], dbacc['rotD50_T0_750'][i],
-                           dbacc['rotD50_T0_800'][i], dbacc['rotD50_T0_900'][i],
-                           dbacc['rotD50_T1_000'][i], dbacc['rotD50_T1_200'][i],
-                           dbacc['rotD50_T1_400'][i], dbacc['rotD50_T1_600'][i],
-                           dbacc['rotD50_T1_800'][i], dbacc['rotD50_T2_000'][i],
-                           dbacc['rotD50_T2_500'][i], dbacc['rotD50_T3_000'][i],
-                           dbacc['rotD50_T3_500'][i], dbacc['rotD50_T4_000'][i],
-                           dbacc['rotD50_T5_000'][i], dbacc['rotD50_T6_000'][i],
-                           dbacc['rotD50_T7_000'][i], dbacc['rotD50_T8_000'][i],
-                           dbacc['rotD50_T9_000'][i],
-                           dbacc['rotD50_T10_000'][i]])
-        sa_geo = None
-        if source[i] == 'ESM':
-            sa_geo = rotd50 / 981  # in g
-        if source[i] == 'NGA-West2':
-            sa_geo = rotd50  # already in g
-        sa_list.append(sa_geo)
-        if all(v > 0 for v in sa_geo):
+        if positive[i]:
             # print('Need to test if the screening of database is ok')
             if source[i] in allowed_database:
                 if (source[i] == 'ESM' and is_free_field_esm[i] == 0) or \
@@ -173,15 +183,41 @@ def screen_database(database_path, allowed_database, allowed_recs_vs30,
                                             else:
                                                 allowed_index.append(i)
 
-    sa = np.vstack(sa_list)
-    sa_known = sa[allowed_index]
+    sa_known = take_rows(sa, allowed_index, block_size)
 
     # count number of allowed spectra
     n_big = len(allowed_index)
     print(['Number of allowed ground motions = ', n_big])
+    count('n_big', n_big)
     assert (n_big >= n_gm), \
         'Warning: there are not enough allowable ground motions'
 
-    return [sa_known, ind_per, rec_per, n_big, allowed_index, event_id,
-            station_code, source, record_sequence_number_nga, event_mw,
-            event_mag, acc_distance, station_vs30, station_ec8]
+    return [sa_known, ind_per, rec_per, n_big, allowed_index] + \
+        database_metadata(dbacc)
+
+
+def database_metadata(database):
+    """
+    Returns the metadata of the ground motions of the :code:`database` used
+    after the screening (columns of the whole database, indexed by the
+    indices in :code:`allowed_index`): event id, station code, source,
+    NGA-West2 record sequence number, Mw, M, epicentral distance, station
+    vs30 and EC8 code.
+    """
+    return [database['event_id'], database['station_code'],
+            database['source'], database['record_sequence_number_NGA'],
+            database['Mw'], database['M'], database['epi_dist'],
+            database['vs30_m_sec'], database['ec8_code']]
+
+
+def read_database(database_path, spectra_store=None):
+    """
+    Reads the database file. If the spectra are read from a
+    :code:`spectra_store`, only the metadata are read.
+    """
+    import pandas as pd
+
+    if spectra_store is None:
+        return pd.read_csv(database_path, sep=';', engine='python')
+    return pd.read_csv(database_path, sep=';', engine='python',
+                       usecols=lambda column: not column.startswith('rotD50'))
@@ -0,0 +1,228 @@
+# Copyright (C) 2020-2021 Elisa Zuccolo, Eucentre Foundation
+#
+# haselREC is free software: you can redistribute it and/or modify it
+# under the terms of the GNU Affero General Public License as published
+# by the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# haselREC is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with haselREC. If not, see <http://www.gnu.org/licenses/>.
+
+def select_ground_motions(random_seed, n_trials, mean_req, cov_req, stdevs,
+                          n_gm, weights, trials_tol, max_trials,
+                          max_trials_time, tgt_per, tstar, avg_periods,
+                          intensity_measures, sa_known, ind_per, n_big, maxsf,
+                          matching, n_loop, penalty, n_workers, optimizer,
+                          max_evaluations, max_optimization_time,
+                          backend='numpy', initial_records=None,
+                          checkpoint=None, checkpoint_interval=60.,
+                          n_pinned=0, block_size=None, milp_threshold=None,
+                          cache_folder=None, cache_keys=None):
+    """
+    Selects a set of ground motions matching the target spectrum distribution
+    from the screened database, for a given :code:`random_seed`:
+
+        1) statistical simulation of response spectra from the target
+           distribution (:code:`simulate_spectra` module)
+        2) selection of ground motions from the database that individually
+           match the statistically simulated spectra
+           (:code:`find_ground_motion` module). The ground motions in
+           :code:`initial_records` (indices in :code:`sa_known`), if any, are
+           used for the first slots of the set. The first :code:`n_pinned`
+           of them are kept in the final set
+        3) optimization of the set (:code:`optimize_ground_motion` or
+           :code:`anneal_ground_motion` module, according to
+           :code:`optimizer`). With :code:`optimizer='milp'`, or when there
+           are at most :code:`milp_threshold` candidate ground motions, the
+           set is selected by mixed-integer linear programming
+           (:code:`milp_ground_motion` module) and then refined by
+           :code:`optimize_ground_motion`
+
+    It returns the indices of the selected ground motions (in
+    :code:`sa_known`), their scale factors, their scaled log-spectra and the
+    trace of the optimization. The state of the optimization is saved to the
+    file :code:`checkpoint`, if given, to resume it after an interruption.
+    When :code:`block_size` is given, the candidate ground motions are
+    streamed in blocks of :code:`block_size` ground motions in steps 2) and
+    3).
+
+    Steps 1), 2) and 3) are the stages `simulation`, `matching` and
+    `optimization`, whose outputs are cached in :code:`cache_folder`
+    (:code:`cached_stage`) when :code:`cache_keys` is given. It contains the
+    keys of the upstream stages: `target` (conditional spectrum) and
+    `candidates` (screened and pruned candidate ground motions). The
+    matching is not cached when :code:`block_size` is given, since its
+    output holds the spectra of all candidates.
+    """
+    from .simulate_spectra import simulate_spectra
+    from .find_ground_motion import find_ground_motion
+    from .stage_cache import cached_stage
+
+    if cache_keys is None:
+        cache_folder = None
+        cache_keys = {}
+
+    simulation_key, simulated_spectra = cached_stage(
+        cache_folder, 'simulation',
+        {'target': cache_keys.get('target'), 'random_seed': random_seed,
+         'n_trials': n_trials, 'n_gm': n_gm, 'weights': weights,
+         'trials_tol': trials_tol, 'max_trials': max_trials,
+         'max_trials_time': max_trials_time},
+        lambda: simulate_spectra(random_seed, n_trials, mean_req, cov_req,
+                                 stdevs, n_gm, weights, trials_tol,
+                                 max_trials, max_trials_time))
+
+    matching_key, matching_output = cached_stage(
+        cache_folder if block_size is None else None, 'matching',
+        {'simulation': simulation_key,
+         'candidates': cache_keys.get('candidates'), 'maxsf': maxsf,
+         'matching': matching, 'initial_records': initial_records,
+         'n_pinned': n_pinned},
+        lambda: find_ground_motion(tgt_per, tstar, avg_periods,
+                                   intensity_measures, n_gm, sa_known,
+                                   ind_per, mean_req, n_big,
+                                   simulated_spectra, maxsf, matching,
+                                   backend, initial_records, n_pinned,
+                                   block_size))
+    [sample_small, sample_big, id_sel, ln_sa1, rec_id, im_scale_fac] = \
+        matching_output
+
+    # Further optimize the ground motion selection
+    optimization_inputs = {'matching': matching_key, 'n_loop': n_loop,
+                           'weights': weights, 'penalty': penalty,
+                           'optimizer': optimizer,
+                           'max_evaluations': max_evaluations,
+                           'max_optimization_time': max_optimization_time,
+                           'milp_threshold': milp_threshold}
+    return cached_stage(cache_folder, 'optimization', optimization_inputs,
+                        lambda: _optimize_selection(
+                            random_seed, n_gm, weights, tgt_per, n_big,
+                            maxsf, n_loop, penalty, n_workers, optimizer,
+                            max_evaluations, max_optimization_time, backend,
+                            checkpoint, checkpoint_interval, n_pinned,
+                            block_size, milp_threshold, mean_req, stdevs,
+                            sample_small, sample_big, id_sel, ln_sa1,
+                            rec_id, im_scale_fac),
+                        checkpoint=checkpoint)[1]
+
+
+def _optimize_selection(random_seed, n_gm, weights, tgt_per, n_big, maxsf,
+                        n_loop, penalty, n_workers, optimizer,
+                        max_evaluations, max_optimization_time, backend,
+                        checkpoint, checkpoint_interval, n_pinned, block_size,
+                        milp_threshold, mean_req, stdevs, sample_small,
+                        sample_big, id_sel, ln_sa1, rec_id, im_scale_fac):
+    """
+    Optimizes the initial set of ground motions (step 3 of
+    :code:`select_ground_motions`, with the same arguments, the outputs of
+    :code:`find_ground_motion` following them).
+    """
+    from .optimize_ground_motion import optimize_ground_motion
+    from .anneal_ground_motion import anneal_ground_motion
+    from .milp_ground_motion import milp_ground_motion
+
+    if optimizer == 'milp' or (milp_threshold is not None and
+                               n_big <= milp_threshold):
+        [rec_id, im_scale_fac, sample_small, trace] = \
+            milp_ground_motion(n_loop, n_gm, sample_small, n_big, id_sel,
+                               ln_sa1, maxsf, sample_big, tgt_per, mean_req,
+                               stdevs, weights, penalty, rec_id, im_scale_fac,
+                               max_optimization_time, n_pinned)
+        [rec_id, im_scale_fac, sample_small, refine_trace] = \
+            optimize_ground_motion(n_loop, n_gm, sample_small, n_big, id_sel,
+                                   ln_sa1, maxsf, sample_big, tgt_per,
+                                   mean_req, stdevs, weights, penalty, rec_id,
+                                   im_scale_fac, n_workers, backend,
+                                   checkpoint, checkpoint_interval, n_pinned,
+                                   block_size)
+        # the loops of the refinement follow the iterations of the program
+        trace = trace + [(len(trace) - 1 + loop, deviation, n_swaps,
+                          loop_time) for loop, deviation, n_swaps, loop_time
+                         in refine_trace[1:]]
+        return rec_id, im_scale_fac, sample_small, trace
+    if optimizer == 'annealing':
+        return anneal_ground_motion(n_loop, n_gm, sample_small, n_big, id_sel,
+                                    ln_sa1, maxsf, sample_big, tgt_per,
+                                    mean_req, stdevs, weights, penalty, rec_id,
+                                    im_scale_fac, random_seed, max_evaluations,
+                                    max_optimization_time, checkpoint,
+                                    checkpoint_interval, n_pinned,
+                                    block_size)
+    return optimize_ground_motion(n_loop, n_gm, sample_small, n_big, id_sel,
+                                  ln_sa1, maxsf, sample_big, tgt_per, mean_req,
+                                  stdevs, weights, penalty, rec_id,
+                                  im_scale_fac, n_workers, backend, checkpoint,
+                                  checkpoint_interval, n_pinned, block_size)
+
+
+def multi_start_selection(n_starts, random_seed, selection_args,
+                          spectra_store=None, rows=None):
+    """
+    Runs :code:`select_ground_motions` for :code:`n_starts` independent random
+    seeds on a pool of processes and keeps the set with the lowest deviation
+    from the target. The first seed is :code:`random_seed`, the others are
+    derived from it, so that the results are reproducible.
+    :code:`selection_args` contains the arguments of
+    :code:`select_ground_motions` following :code:`random_seed`.
+
+    When the spectra of the candidates are read from a
+    :code:`spectra_store`, they are not sent to the processes of the pool
+    (a memory-mapped array would be copied in full): each process maps the
+    store again and takes its :code:`rows` (indices of the candidates in the
+    store).
+
+    It returns the outputs of :code:`select_ground_motions` for the best set
+    and the list of (seed, deviation) of all the starts.
+    """
+    import os
+    import numpy as np
+    from concurrent.futures import ProcessPoolExecutor
+
+    seeds = [random_seed] + [int(seed) for seed in np.random.SeedSequence(
+        random_seed).generate_state(n_starts - 1)]
+
+    if n_starts == 1:
+        results = [select_ground_motions(random_seed, *selection_args)]
+    else:
+        with ProcessPoolExecutor(min(n_starts, os.cpu_count())) as executor:
+            if spectra_store is None:
+                futures = [executor.submit(select_ground_motions, seed,
+                                           *selection_args)
+                           for seed in seeds]
+            else:
+                # (sa_known is the 14th argument of select_ground_motions,
+                # block_size the 30th)
+                args = list(selection_args)
+                args[13] = None
+                futures = [executor.submit(_start_from_store, seed, args,
+                                           spectra_store, rows)
+                           for seed in seeds]
+            results = [future.result() for future in futures]
+
+    # the deviation of the final set is the last one of the trace
+    deviations = [result[3][-1][1] for result in results]
+    best = int(np.argmin(deviations))
+    starts = list(zip(seeds, deviations))
+    if n_starts > 1:
+        print(['Best start = ', best + 1, ' random seed = ', seeds[best]])
+    return results[best], starts
+
+
+def _start_from_store(random_seed, selection_args, spectra_store, rows):
+    """
+    Runs :code:`select_ground_motions` in a process of the pool of
+    :code:`multi_start_selection`, taking the spectra of the candidates from
+    the :code:`rows` of the :code:`spectra_store`.
+    """
+    import numpy as np
+    from .candidate_store import take_rows
+
+    selection_args = list(selection_args)
+    selection_args[13] = take_rows(np.load(spectra_store, mmap_mode='r'),
+                                   rows, selection_args[29])
+    return select_ground_motions(random_seed, *selection_args)
@@ -0,0 +1,222 @@
+# Copyright (C) 2020-2021 Elisa Zuccolo, Eucentre Foundation
+#
+# haselREC is free software: you can redistribute it and/or modify it
+# under the terms of the GNU Affero General Public License as published
+# by the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# haselREC is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with haselREC. If not, see <http://www.gnu.org/licenses/>.
+
+"""
+In-process interface of the record selection: :code:`select` performs the
+selection described by a :code:`SelectionConfig` and returns the results as
+:code:`SelectionResult` objects, without writing files unless requested.
+"""
+
+import typing
+import dataclasses
+
+import numpy as np
+
+# names of the outputs of read_input_data, in order
+_INI_FIELDS = (
+    'intensity_measures', 'site_code', 'rlz_code', 'path_results_classical',
+    'path_results_disagg', 'num_disagg', 'num_classical',
+    'probability_of_exceedance_num', 'probability_of_exceedance',
+    'investigation_time', 'target_periods', 'tstar', 'im_type', 'im_type_lbl',
+    'avg_periods', 'corr_type', 'gmpe_input', 'rake', 'vs30', 'vs30type',
+    'hypo_depth', 'dip', 'azimuth', 'fhw', 'z2pt5', 'z1pt0', 'upper_sd',
+    'lower_sd', 'database_path', 'allowed_database', 'allowed_recs_vs30',
+    'allowed_ec8_code', 'maxsf_input', 'radius_dist_input',
+    'radius_mag_input', 'allowed_depth', 'n_gm', 'random_seed', 'n_trials',
+    'weights', 'n_loop', 'penalty', 'path_nga_folder', 'path_esm_folder',
+    'output_folder', 'trials_tol', 'max_trials', 'max_trials_time',
+    'matching', 'prune_sigma', 'prune_fraction', 'n_workers', 'optimizer',
+    'max_evaluations', 'max_optimization_time', 'n_starts', 'backend',
+    'warm_start', 'checkpoint_interval', 'extend_selection', 'spectra_store',
+    'block_size', 'milp_threshold', 'stage_cache', 'metrics_file')
+
+# databases already loaded by select, by path, store and modification time
+_databases = {}
+
+
+@dataclasses.dataclass
+class SelectionConfig:
+    """
+    Parameters of the record selection, with the names and meaning of the
+    arguments of :code:`selection_module` (see :code:`read_input_data` for
+    their description). It is usually created from an input file
+    (:code:`from_ini`) and modified with :code:`dataclasses.replace`.
+    """
+    intensity_measures: typing.Sequence[str]
+    site_code: typing.Sequence[int]
+    rlz_code: typing.Sequence[int]
+    path_results_classical: str
+    path_results_disagg: str
+    num_disagg: int
+    num_classical: int
+    probability_of_exceedance_num: typing.Sequence[int]
+    probability_of_exceedance: typing.Sequence[str]
+    investigation_time: float
+    target_periods: np.ndarray
+    tstar: np.ndarray
+    im_type: typing.Sequence[str]
+    im_type_lbl: typing.Sequence[str]
+    avg_periods: typing.Sequence[float]
+    corr_type: str
+    gmpe_input: str
+    rake: float
+    vs30: typing.Sequence[str]
+    vs30type: typing.Sequence[str]
+    database_path: str
+    allowed_database: typing.Sequence[str]
+    maxsf_input: typing.Union[float, np.ndarray]
+    radius_dist_input: typing.Union[float, np.ndarray]
+    radius_mag_input: typing.Union[float, np.ndarray]
+    allowed_depth: np.ndarray
+    n_gm: int
+    random_seed: int
+    n_trials: int
+    weights: np.ndarray
+    n_loop: int
+    penalty: float
+    hypo_depth: typing.Optional[float] = None
+    dip: typing.Optional[float] = None
+    azimuth: typing.Optional[float] = None
+    fhw: typing.Optional[int] = None
+    z2pt5: typing.Optional[typing.Sequence[str]] = None
+    z1pt0: typing.Optional[typing.Sequence[str]] = None
+    upper_sd: typing.Optional[float] = None
+    lower_sd: typing.Optional[float] = None
+    allowed_recs_vs30: typing.Optional[np.ndarray] = None
+    allowed_ec8_code: typing.Optional[typing.Sequence[str]] = None
+    output_folder: typing.Optional[str] = None
+    trials_tol: typing.Optional[float] = None
+    max_trials: typing.Optional[int] = None
+    max_trials_time: typing.Optional[float] = None
+    matching: str = 'greedy'
+    prune_sigma: typing.Optional[float] = None
+    prune_fraction: float = 0.5
+    n_workers: int = 1
+    optimizer: str = 'greedy'
+    max_evaluations: typing.Optional[int] = None
+    max_optimization_time: typing.Optional[float] = None
+    n_starts: int = 1
+    backend: str = 'numpy'
+    warm_start: bool = False
+    checkpoint_interval: float = 60.
+    extend_selection: bool = False
+    spectra_store: typing.Optional[str] = None
+    block_size: typing.Optional[int] = None
+    milp_threshold: typing.Optional[int] = None
+    stage_cache: bool = False
+    metrics_file: typing.Optional[str] = None
+
+    @classmethod
+    def from_ini(cls, fileini):
+        """
+        Creates the configuration from the input file :code:`fileini`
+        (:code:`read_input_data`).
+        """
+        from .read_input_data import read_input_data
+
+        values = dict(zip(_INI_FIELDS, read_input_data(fileini)))
+        # the accelerogram folders are used by the scaling only
+        del values['path_nga_folder']
+        del values['path_esm_folder']
+        return cls(**values)
+
+
+class SelectionResult:
+    """
+    Result of the selection for a case (site, probability of exceedance and
+    intensity measure):
+
+        - :code:`name`: name of the case (name of its output folder)
+        - :code:`site`, :code:`poe`, :code:`intensity_measure`: site number,
+          probability of exceedance number and intensity measure of the case
+        - :code:`record_indices`: indices (rows of the database file) of the
+          selected ground motions
+        - :code:`scale_factors`: their scale factors
+        - :code:`periods`: periods of the spectra
+        - :code:`mean`, :code:`covariance`: mean and covariance of the
+          logarithm of the conditional spectrum
+        - :code:`spectra`: scaled response spectra (g) of the selected ground
+          motions (one row per ground motion)
+        - :code:`im_star`, :code:`magnitude`, :code:`distance`: conditioning
+          value, mean magnitude and distance from the disaggregation
+        - :code:`trace`: trace of the optimization (loop, deviation, number
+          of swaps, time)
+    """
+    __slots__ = ('name', 'site', 'poe', 'intensity_measure', 'record_indices',
+                 'scale_factors', 'periods', 'mean', 'covariance', 'spectra',
+                 'im_star', 'magnitude', 'distance', 'trace')
+
+    def __init__(self, **values):
+        for key in self.__slots__:
+            setattr(self, key, values[key])
+
+    def to_dict(self):
+        """
+        Returns the result as a dictionary of plain Python values (arrays
+        converted to lists), e.g. to be serialized to JSON.
+        """
+        return {key: np.asarray(getattr(self, key)).tolist()
+                for key in self.__slots__}
+
+    def __repr__(self):
+        return ('SelectionResult(' + self.name + ', ' +
+                str(len(self.record_indices)) + ' records, deviation = ' +
+                str(self.trace[-1][1]) + ')')
+
+
+def select(config, output_files=False, plot=False):
+    """
+    Performs the record selection described by :code:`config`
+    (:code:`SelectionConfig`) in the current process, for each case (site,
+    probability of exceedance and intensity measure), as
+    :code:`selection_module` does.
+
+    It returns the list of the results of the cases (:code:`SelectionResult`
+    objects), in the order of :code:`selection_module`. The output files and
+    the figures are written to :code:`config.output_folder` only if
+    :code:`output_files` and :code:`plot` are True, respectively; otherwise
+    nothing is written to disk (except the stage cache, if enabled).
+
+    The database file is loaded once per process and reused by the
+    following calls, as long as it is not modified.
+    """
+    import os
+    import sys
+    from .screen_database import read_database
+    from .candidate_store import prepare_spectra_store
+    from .selection_case import selection_case, list_cases
+
+    if (output_files or plot) and config.output_folder is None:
+        sys.exit('Error: the output folder must be defined to write the '
+                 'output files or the figures')
+
+    if config.spectra_store is not None:
+        prepare_spectra_store(config.database_path, config.spectra_store)
+    key = (config.database_path, config.spectra_store,
+           os.path.getmtime(config.database_path))
+    if key not in _databases:
+        _databases.clear()
+        _databases[key] = read_database(config.database_path,
+                                        config.spectra_store)
+
+    cases = list_cases(config.site_code,
+                       config.probability_of_exceedance_num,
+                       config.intensity_measures)
+
+    # (dataclasses.asdict would copy the arrays)
+    values = {field.name: getattr(config, field.name)
+              for field in dataclasses.fields(config)}
+    return selection_case(cases, _databases[key], **values,
+                          output_files=output_files, plot=plot)
@@ -0,0 +1,512 @@
+# Copyright (C) 2020-2021 Elisa Zuccolo, Eucentre Foundation
+#
+# haselREC is free software: you can redistribute it and/or modify it
+# under the terms of the GNU Affero General Public License as published
+# by the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# haselREC is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with haselREC. If not, see <http://www.gnu.org/licenses/>.
+
+"""
+Record selection for a list of (site, probability of exceedance, intensity
+measure) cases, run either in the main process or in a pool of processes
+(:code:`run_tasks`).
+"""
+
+_shared = {}
+
+
+def selection_case(cases, database, intensity_measures, site_code, rlz_code,
+                   path_results_classical, path_results_disagg, num_disagg,
+                   num_classical, probability_of_exceedance_num,
+                   probability_of_exceedance, investigation_time,
+                   target_periods, tstar, im_type, im_type_lbl, avg_periods,
+                   corr_type, gmpe_input, rake, vs30, vs30type, hypo_depth,
+                   dip, azimuth, fhw, z2pt5, z1pt0, upper_sd, lower_sd,
+                   database_path, allowed_database, allowed_recs_vs30,
+                   allowed_ec8_code, maxsf_input, radius_dist_input,
+                   radius_mag_input, allowed_depth, n_gm, random_seed,
+                   n_trials, weights, n_loop, penalty, output_folder,
+                   trials_tol=None, max_trials=None, max_trials_time=None,
+                   matching='greedy', prune_sigma=None, prune_fraction=0.5,
+                   n_workers=1, optimizer='greedy', max_evaluations=None,
+                   max_optimization_time=None, n_starts=1, backend='numpy',
+                   warm_start=False, checkpoint_interval=60.,
+                   extend_selection=False, spectra_store=None, block_size=None,
+                   milp_threshold=None, force=False, only=None,
+                   stage_cache=False, output_files=True, plot=True,
+                   metrics_file=None):
+    """
+    Performs the record selection for the :code:`cases` (list of case number,
+    site index, probability of exceedance index and intensity measure index),
+    in the given order, as described in :code:`selection_module`. The other
+    arguments are those of :code:`selection_module`, :code:`database` being
+    the database file already loaded (:code:`read_database`).
+
+    The warm start (:code:`warm_start`) uses the records selected for the
+    previous cases of the list, for the same site and intensity measure.
+
+    When the spectra are read from a :code:`spectra_store`, the candidates
+    are processed in blocks of :code:`block_size` ground motions (default
+    100000).
+
+    The cases whose outputs are up to date with their fingerprint (computed
+    by :code:`fingerprint` module from the parameters and the input files
+    affecting the case) are skipped, unless :code:`force` is True. Only the
+    cases passing the filter :code:`only` (see :code:`parse_only`) are
+    processed.
+
+    When :code:`stage_cache` is True, the outputs of the stages of the
+    selection (conditioning value, screening, conditional spectrum, pruning,
+    simulation, matching and optimization) are cached in the folder
+    `.cache` of the output folder (:code:`stage_cache` module), so that
+    only the stages affected by a change of the inputs are computed again.
+
+    The output files (:code:`create_output_files`) and the figures
+    (:code:`plot_final_selection`) are produced only if :code:`output_files`
+    and :code:`plot` are True, respectively. Without output files, the
+    cases are never skipped and the optimization is not checkpointed.
+
+    When :code:`metrics_file` is given, the time, the counters and the peak
+    memory of each stage of each case are appended to it (:code:`metrics`
+    module).
+
+    It returns the list of the results of the cases (:code:`SelectionResult`
+    objects).
+    """
+    arguments = dict(locals())
+
+    import os
+    import sys
+    import numpy as np
+    from .compute_conditioning_value import compute_conditioning_value, \
+        hazard_files
+    from .screen_database import screen_database, database_metadata
+    from .plot_final_selection import plot_final_selection
+    from .input_GMPE import inizialize_gmm
+    from .create_output_files import create_output_files
+    from .compute_cs import compute_cs
+    from .prune_candidates import prune_candidates
+    from .select_ground_motions import multi_start_selection
+    from .read_previous_selection import read_previous_selection
+    from .candidate_store import take_rows
+    from .stage_cache import stage_key, cached_stage
+    from .selection_api import SelectionResult
+    from .metrics import start_metrics, stage_metrics
+    from .fingerprint import case_fingerprint, up_to_date, \
+        write_fingerprint, remove_fingerprint, case_selected
+
+    # records (indices in the database) selected for the last probability of
+    # exceedance, for each site and intensity measure
+    previous_records = {}
+    # and their fingerprints (the warm start makes a case depend on them)
+    previous_fingerprints = {}
+    results = []
+
+    cache_folder = None
+    if stage_cache and output_folder is not None:
+        cache_folder = output_folder + '/.cache'
+
+    # the spectra of the store are always streamed
+    if spectra_store is not None and block_size is None:
+        block_size = 100000
+
+    for ind, ii, jj, im in cases:
+
+        # Capture the screen output per case when run in a pool
+        if 'output' in _shared:
+            _shared['output'].case = ind
+
+        # Get the current site and realisation indices
+        site = site_code[ii]
+        rlz = rlz_code[ii]
+        poe = probability_of_exceedance_num[jj]
+
+        if hasattr(maxsf_input, '__len__'):
+            maxsf = maxsf_input[jj]
+        else:
+            maxsf = maxsf_input
+        if hasattr(radius_dist_input, '__len__'):
+            radius_dist = radius_dist_input[jj]
+        else:
+            radius_dist = radius_dist_input
+        if hasattr(radius_mag_input, '__len__'):
+            radius_mag = radius_mag_input[jj]
+        else:
+            radius_mag = radius_mag_input
+
+        name = intensity_measures[im] + '-site_' + str(
+            site) + '-poe-' + str(poe)
+
+        # Skip the case if its outputs are up to date
+        parameters = _case_parameters(arguments, ii, jj, im, maxsf,
+                                      radius_dist, radius_mag)
+        if warm_start:
+            parameters['previous'] = previous_fingerprints.get((site, im))
+        files = [database_path] + list(hazard_files(
+            rlz, intensity_measures[im], site, poe, num_disagg,
+            num_classical, path_results_disagg, path_results_classical))
+        info = None
+        if output_files:
+            fingerprint = case_fingerprint(parameters, files)
+            outputs = [output_folder + '/' + name + '/' + name + suffix for
+                       suffix in ['_summary_selection.txt', '_CS.txt']]
+            if not force:
+                info = up_to_date(output_folder, name, 'selection',
+                                  fingerprint, outputs)
+        if info is not None:
+            previous_records[(site, im)] = info['records']
+            previous_fingerprints[(site, im)] = fingerprint
+        if not case_selected(only, site, poe, intensity_measures[im]):
+            continue
+        if info is not None:
+            print('Skipping ' + name + ' (up to date)')
+            continue
+
+        # Print some on screen feedback
+        print('Processing ' + name + ' Case: ' + str(ind) + '/' + str(
+            len(site_code) * len(probability_of_exceedance_num) * len(
+                intensity_measures)))
+        start_metrics(metrics_file, name)
+
+        conditioning_key, [im_star, rjb, mag] = cached_stage(
+            cache_folder, 'conditioning',
+            {key: parameters[key] for key in
+             ['rlz_code', 'intensity_measures', 'site_code',
+              'probability_of_exceedance_num', 'num_disagg',
+              'probability_of_exceedance', 'num_classical',
+              'investigation_time']},
+            lambda: compute_conditioning_value(
+                rlz, intensity_measures[im], site, poe, num_disagg,
+                probability_of_exceedance[jj], num_classical,
+                path_results_disagg, investigation_time,
+                path_results_classical),
+            files[1:])
+
+        with stage_metrics('gmm'):
+            [bgmpe, sctx, rctx, dctx, site_vs30, rrup] = \
+                inizialize_gmm(ii, gmpe_input, rjb, mag, hypo_depth, dip,
+                               rake, upper_sd, lower_sd, azimuth, fhw,
+                               vs30type, vs30, z2pt5, z1pt0)
+
+        # Screen the database of available ground motions
+
+        # (the spectra of the store are not copied to the cache, the
+        # metadata are taken from the database)
+        screening_key, [sa_known, ind_per, tgt_per, n_big,
+                        allowed_index] = cached_stage(
+            cache_folder if spectra_store is None else None, 'screening',
+            {'conditioning': conditioning_key,
+             'allowed_database': allowed_database,
+             'allowed_recs_vs30': allowed_recs_vs30,
+             'radius_dist': radius_dist, 'radius_mag': radius_mag,
+             'allowed_ec8_code': allowed_ec8_code,
+             'target_periods': target_periods, 'n_gm': n_gm,
+             'allowed_depth': allowed_depth, 'site_vs30': site_vs30},
+            lambda: screen_database(database_path, allowed_database,
+                                    allowed_recs_vs30, radius_dist,
+                                    radius_mag, rjb, mag, allowed_ec8_code,
+                                    target_periods, n_gm, allowed_depth,
+                                    site_vs30, spectra_store, block_size,
+                                    database)[0:5],
+            [database_path])
+        [event_id, station_code, source, record_sequence_number_nga,
+         event_mw, event_mag, acc_distance, station_vs30, station_ec8] = \
+            database_metadata(database)
+
+        # Compute the target spectrum
+
+        target_key, [mean_req, cov_req, stdevs] = cached_stage(
+            cache_folder, 'target',
+            dict({key: parameters[key] for key in
+                  ['gmpe_input', 'rake', 'vs30', 'vs30type', 'hypo_depth',
+                   'dip', 'azimuth', 'fhw', 'z2pt5', 'z1pt0', 'upper_sd',
+                   'lower_sd', 'target_periods', 'im_type', 'tstar',
+                   'avg_periods', 'corr_type']},
+                 conditioning=conditioning_key),
+            lambda: compute_cs(tgt_per, bgmpe, sctx, rctx, dctx, im_type[im],
+                               tstar[im], rrup, mag, avg_periods, corr_type,
+                               im_star, gmpe_input))
+
+        # Records of the existing selection to be extended
+
+        pinned_records = None
+        if extend_selection:
+            pinned_records = read_previous_selection(
+                output_folder, name, n_gm, allowed_index, source,
+                event_id, station_code, record_sequence_number_nga)
+
+        # Remove the candidates far from the target distribution
+
+        pruning_key = None
+        if prune_sigma is not None:
+            pruning_key, keep = cached_stage(
+                cache_folder, 'pruning',
+                {'screening': screening_key, 'target': target_key,
+                 'n_gm': n_gm, 'maxsf': maxsf, 'prune_sigma': prune_sigma,
+                 'prune_fraction': prune_fraction},
+                lambda: prune_candidates(tgt_per, tstar[im], avg_periods,
+                                         intensity_measures[im], n_gm,
+                                         sa_known, ind_per, mean_req,
+                                         stdevs, maxsf, prune_sigma,
+                                         prune_fraction, block_size))
+            if pinned_records is not None:
+                keep = np.union1d(keep, [allowed_index.index(i) for
+                                         i in pinned_records])
+            sa_known = take_rows(sa_known, keep, block_size)
+            allowed_index = [allowed_index[i] for i in keep]
+            n_big = len(keep)
+
+        # Start from the records selected for the previous
+        # probability of exceedance, if still allowed
+        initial_records = None
+        n_pinned = 0
+        if pinned_records is not None:
+            position = {allowed_index[i]: i for i in np.arange(n_big)}
+            initial_records = [position[i] for i in pinned_records]
+            n_pinned = len(initial_records)
+        elif warm_start and (site, im) in previous_records:
+            position = {allowed_index[i]: i for i in np.arange(n_big)}
+            initial_records = [position[i] for i in
+                               previous_records[(site, im)]
+                               if i in position]
+
+        # Create the outputs folder
+        checkpoint = None
+        if output_files or plot:
+            folder = output_folder + '/' + name
+            if not os.path.exists(folder):
+                os.makedirs(folder)
+        if output_files:
+            remove_fingerprint(output_folder, name, 'selection')
+            if n_starts == 1:
+                checkpoint = folder + '/' + name + '_checkpoint.npz'
+
+        # Simulate spectra, select and optimize the ground motion set
+        # (for each random seed if more starts are required)
+
+        cache_keys = None
+        if cache_folder is not None:
+            cache_keys = {'target': target_key,
+                          'candidates': stage_key(
+                              'candidates', {'screening': screening_key,
+                                             'pruning': pruning_key,
+                                             'pinned': pinned_records})}
+
+        [[final_records, final_scale_factors, sample_small, trace],
+         starts] = \
+            multi_start_selection(n_starts, random_seed,
+                                  (n_trials, mean_req, cov_req, stdevs,
+                                   n_gm, weights, trials_tol,
+                                   max_trials, max_trials_time,
+                                   tgt_per, tstar[im], avg_periods,
+                                   intensity_measures[im], sa_known,
+                                   ind_per, n_big, maxsf, matching,
+                                   n_loop, penalty, n_workers,
+                                   optimizer, max_evaluations,
+                                   max_optimization_time, backend,
+                                   initial_records, checkpoint,
+                                   checkpoint_interval, n_pinned,
+                                   block_size, milp_threshold,
+                                   cache_folder, cache_keys),
+                                  spectra_store, allowed_index)
+        if n_starts == 1:
+            starts = None
+
+        # Plot the figure
+        if plot:
+            with stage_metrics('plotting'):
+                plot_final_selection(name, im_type_lbl[im], n_gm, tgt_per,
+                                     sample_small, mean_req, stdevs,
+                                     output_folder)
+
+        # Collect information of the final record set
+        rec_idx = [allowed_index[i] for i in final_records]
+        previous_records[(site, im)] = rec_idx
+        results.append(SelectionResult(
+            name=name, site=site, poe=poe,
+            intensity_measure=intensity_measures[im],
+            record_indices=np.array(rec_idx),
+            scale_factors=np.asarray(final_scale_factors),
+            periods=np.asarray(tgt_per), mean=mean_req,
+            covariance=cov_req, spectra=np.exp(sample_small),
+            im_star=im_star, magnitude=mag, distance=rjb[0],
+            trace=trace))
+        if not output_files:
+            continue
+
+        # Create the summary file along with the file with the CS
+        with stage_metrics('output_files'):
+            create_output_files(output_folder, name, im_star, mag,
+                                rjb[0], n_gm, rec_idx, source, event_id,
+                                station_code, event_mw, acc_distance,
+                                station_vs30, station_ec8,
+                                final_scale_factors, tgt_per, mean_req,
+                                stdevs, record_sequence_number_nga,
+                                event_mag, trace, starts)
+
+        # Stop the run if the optimization was interrupted, otherwise record
+        # the fingerprint of the case
+        if checkpoint is not None and os.path.exists(checkpoint):
+            sys.exit('Selection interrupted: run it again to resume '
+                     'from ' + checkpoint)
+        write_fingerprint(output_folder, name, 'selection', fingerprint,
+                          records=[int(i) for i in rec_idx])
+        previous_fingerprints[(site, im)] = fingerprint
+
+    return results
+
+
+def _case_parameters(arguments, ii, jj, im, maxsf, radius_dist, radius_mag):
+    """
+    Returns the parameters affecting the case of site index :code:`ii`,
+    probability of exceedance index :code:`jj` and intensity measure index
+    :code:`im`, given the :code:`arguments` of :code:`selection_case`.
+    Parameters given per site, per probability of exceedance or per
+    intensity measure are reduced to the value of the case, while the
+    parameters that do not change the results (e.g. number of processes,
+    block size) are excluded.
+    """
+    parameters = dict(arguments)
+    for key in ['cases', 'database', 'output_folder', 'n_workers',
+                'checkpoint_interval', 'spectra_store', 'block_size',
+                'force', 'only', 'stage_cache', 'output_files', 'plot',
+                'metrics_file', 'maxsf_input', 'radius_dist_input',
+                'radius_mag_input']:
+        del parameters[key]
+    for key in ['site_code', 'rlz_code', 'vs30', 'vs30type', 'z2pt5',
+                'z1pt0']:
+        if parameters[key] is not None:
+            parameters[key] = parameters[key][ii]
+    for key in ['probability_of_exceedance_num',
+                'probability_of_exceedance']:
+        parameters[key] = parameters[key][jj]
+    for key in ['intensity_measures', 'tstar', 'im_type', 'im_type_lbl']:
+        parameters[key] = parameters[key][im]
+    parameters['maxsf'] = maxsf
+    parameters['radius_dist'] = radius_dist
+    parameters['radius_mag'] = radius_mag
+    return parameters
+
+
+def list_cases(site_code, probability_of_exceedance_num,
+               intensity_measures):
+    """
+    Returns the cases of the selection, for each site, each probability of
+    exceedance and each intensity measure: case number, site index,
+    probability of exceedance index and intensity measure index.
+    """
+    cases = []
+    for ii in range(len(site_code)):
+        for jj in range(len(probability_of_exceedance_num)):
+            for im in range(len(intensity_measures)):
+                cases.append((len(cases) + 1, ii, jj, im))
+    return cases
+
+
+def case_tasks(job, cases, warm_start):
+    """
+    Splits the :code:`cases` of the :code:`job` (index) into tasks for the
+    pool of processes: (job, list of cases). With the warm start, the cases
+    of the same site and intensity measure are processed in a single task,
+    in order of probability of exceedance.
+    """
+    if not warm_start:
+        return [(job, [case]) for case in cases]
+    chains = {}
+    for case in cases:
+        chains.setdefault((case[1], case[3]), []).append(case)
+    return [(job, chain) for chain in chains.values()]
+
+
+def run_tasks(jobs, tasks, n_jobs):
+    """
+    Runs the :code:`tasks` (see :code:`case_tasks`) on a pool of
+    :code:`n_jobs` processes, :code:`jobs` being the list of the inputs of
+    :code:`selection_case` (except the cases) of each job. The inputs are
+    passed once to each process. The screen output of each case is printed
+    in the order of the jobs and of the case numbers, whatever the grouping
+    of the cases in tasks, and the first error (:code:`sys.exit` or
+    exception, e.g. a failed assertion) cancels the remaining tasks and is
+    raised again, after the output of the cases already run.
+    """
+    from concurrent.futures import ProcessPoolExecutor
+
+    order = sorted((job, case[0]) for job, cases in tasks for case in cases)
+    received = {}
+    printed = 0
+    with ProcessPoolExecutor(n_jobs, initializer=init_worker,
+                             initargs=(jobs,)) as executor:
+        for (job, cases), (outputs, error) in zip(
+                tasks, executor.map(run_cases, tasks)):
+            for case in cases:
+                received[(job, case[0])] = outputs.get(case[0], '')
+            if error is not None:
+                for key in order[printed:]:
+                    print(received.get(key, ''), end='')
+                executor.shutdown(cancel_futures=True)
+                raise error
+            while printed < len(order) and order[printed] in received:
+                print(received.pop(order[printed]), end='')
+                printed += 1
+
+
+def init_worker(jobs):
+    """
+    Stores the inputs of :code:`selection_case` of each job, shared by all
+    cases, in each process of the pool (inherited without copy when the
+    processes are forked).
+    """
+    _shared['jobs'] = jobs
+
+
+def run_cases(task):
+    """
+    Runs :code:`selection_case` for the task (job index and cases) in a
+    process of the pool. The screen output is captured per case number and
+    returned, so that the outputs of the cases are printed in order. An
+    error (:code:`sys.exit` or exception) is returned instead of being
+    raised, to be raised again in the main process; the traceback of an
+    exception is appended to the output of the current case.
+    """
+    import traceback
+    from contextlib import redirect_stdout
+
+    job, cases = task
+    output = CaseOutput(cases[0][0])
+    _shared['output'] = output
+    error = None
+    with redirect_stdout(output):
+        try:
+            selection_case(cases, **_shared['jobs'][job])
+        except SystemExit as exit_error:
+            error = exit_error
+        except Exception as exception:
+            traceback.print_exc(file=output)
+            error = exception
+    del _shared['output']
+    return output.outputs, error
+
+
+class CaseOutput:
+    """
+    Screen output of a task of the pool, captured separately for each case
+    number (:code:`case`, set by :code:`selection_case` when a case starts).
+    """
+
+    def __init__(self, case):
+        self.case = case
+        self.outputs = {}
+
+    def write(self, text):
+        self.outputs[self.case] = self.outputs.get(self.case, '') + text
+        return len(text)
+
+    def flush(self):
+        pass
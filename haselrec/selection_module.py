@@ -23,7 +23,16 @@ def selection_module(intensity_measures, site_code, rlz_code,
                      database_path, allowed_database, allowed_recs_vs30,
                      allowed_ec8_code, maxsf_input, radius_dist_input,
                      radius_mag_input, allowed_depth, n_gm, random_seed,
-                     n_trials, weights, n_loop, penalty, output_folder):
+                     n_trials, weights, n_loop, penalty, output_folder,
+                     trials_tol=None, max_trials=None, max_trials_time=None,
+                     matching='greedy', prune_sigma=None, prune_fraction=0.5,
+                     n_workers=1, optimizer='greedy', max_evaluations=None,
+                     max_optimization_time=None, n_starts=1,
+                     backend='numpy', warm_start=False,
+                     checkpoint_interval=60., extend_selection=False,
+                     spectra_store=None, block_size=None,
+                     milp_threshold=None, n_jobs=1, force=False,
+                     only=None, stage_cache=False, metrics_file=None):
     """
     This module is called when mode :code:`--run-selection` is specified.
 
@@ -35,7 +44,9 @@ def selection_module(intensity_measures, site_code, rlz_code,
         3) screening of the database of candidate ground motion
            (:code:`screen_database` module)
         4) computation of the target response spectrum distribution
-           (:code:`compute_cs` module)
+           (:code:`compute_cs` module) and, optionally, removal of the
+           candidate ground motions far from the target distribution
+           (:code:`prune_candidates` module)
         5) statistical simulation of response spectra from the target
            distribution
            (:code:`simulate_spectra` module)
@@ -44,138 +55,95 @@ def selection_module(intensity_measures, site_code, rlz_code,
            (:code:`find_ground_motion` module)
         7) execution of incremental changes to the initially selected ground
            motion set to further optimize its fit to the target spectrum
-           distribution (:code:`optimize_ground_motion` module)
+           distribution (:code:`optimize_ground_motion` module or, if
+           :code:`optimizer=annealing`, :code:`anneal_ground_motion` module;
+           if :code:`optimizer=milp` or if there are at most
+           :code:`milp_threshold` candidate ground motions,
+           :code:`milp_ground_motion` module)
         8) produce output files (3 figures created by :code:`plot_final_selection`
-           module and 2 `.txt` files created by :code:`create_output_files` modules)
+           module and 3 `.txt` files created by :code:`create_output_files` modules)
+
+    Steps 1) to 8) are performed for each case (site, probability of
+    exceedance and intensity measure) by the :code:`selection_case` module.
+    When :code:`n_jobs` > 1, the cases are processed on a pool of
+    :code:`n_jobs` processes, which share the database file loaded once. The
+    results do not depend on :code:`n_jobs`, since each case uses the same
+    :code:`random_seed`, the output files are written atomically and the
+    screen output of each case is printed in the order of the case numbers,
+    whatever the grouping of the cases in tasks (:code:`warm_start`).
+
+    Each case folder records a fingerprint of the parameters and input files
+    affecting the case and of the haselREC version (:code:`fingerprint`
+    module). Running the selection again skips the cases whose outputs exist
+    and whose fingerprint matches, unless :code:`force` is True. The cases
+    can be restricted with the filter :code:`only` (e.g.
+    :code:`{'site': ['1'], 'im': ['PGA']}`, see :code:`parse_only`).
+
+    When :code:`stage_cache` is True, the output of each stage of the
+    selection is cached in the folder `.cache` of the output folder
+    (:code:`stage_cache` module), keyed by the inputs of the stage and the
+    keys of the upstream stages. A case computed again after a change of the
+    inputs (e.g. :code:`penalty`) only recomputes the stages downstream of
+    the change (e.g. the optimization).
+
+    When :code:`metrics_file` is defined, the wall time, the CPU time, the
+    memory and the counters of each stage of each case are appended to
+    it as JSON lines (:code:`metrics` module).
+
+    Steps 5) to 7) are performed by the :code:`select_ground_motions` module.
+    When :code:`n_starts` > 1, they are repeated on a pool of processes for
+    several random seeds and the best set is retained.
+
+    When :code:`warm_start` is True, the initial set of each case contains the
+    ground motions selected for the previous probability of exceedance at the
+    same site and for the same intensity measure, rescaled to the new
+    conditioning value, if they are still allowed. The optimization then
+    converges in few loops.
+
+    The state of the optimization of each case is saved every
+    :code:`checkpoint_interval` seconds to a checkpoint file in the folder of
+    the case (when :code:`n_starts` = 1). If the run is interrupted (Ctrl-C)
+    during the optimization, the outputs of the case are produced with the
+    best set found so far and the run stops; running the selection again
+    resumes the optimization from the checkpoint.
+
+    When :code:`extend_selection` is True, the existing selection of each case
+    (summary file in the output folder, read by
+    :code:`read_previous_selection` module) is extended to :code:`n_gm`
+    records: the existing records are kept, in the same order, and only the
+    additional ones are selected and optimized.
+
+    When :code:`spectra_store` is given, the spectra of the database are read
+    from a memory-mapped store (created from the database file by
+    :code:`candidate_store` module if it does not exist or does not match
+    the database file), so that very large databases are never held in
+    memory. When :code:`block_size` is given, the candidate ground motions
+    are streamed in blocks of :code:`block_size` ground motions during
+    pruning, matching and optimization.
 
     """
-    import os
-    import numpy as np
-    from .compute_conditioning_value import compute_conditioning_value
-    from .screen_database import screen_database
-    from .simulate_spectra import simulate_spectra
-    from .plot_final_selection import plot_final_selection
-    from .input_GMPE import inizialize_gmm
-    from .create_output_files import create_output_files
-    from .compute_cs import compute_cs
-    from .find_ground_motion import find_ground_motion
-    from .optimize_ground_motion import optimize_ground_motion
+    # inputs shared by all cases (arguments of selection_case)
+    inputs = dict(locals())
+    del inputs['n_jobs']
+
+    from .screen_database import read_database
+    from .candidate_store import prepare_spectra_store
+    from .selection_case import selection_case, list_cases, case_tasks, \
+        run_tasks
 
     # %% Start the routine
     print('Inputs loaded, starting selection....')
-    ind = 1
-
-    # For each site investigated
-    for ii in np.arange(len(site_code)):
-
-        # Get the current site and realisation indices
-        site = site_code[ii]
-        rlz = rlz_code[ii]
-
-        # For each hazard of poe level investigated
-        for jj in np.arange(len(probability_of_exceedance_num)):
-
-            poe = probability_of_exceedance_num[jj]
-
-            if hasattr(maxsf_input, '__len__'):
-                maxsf = maxsf_input[jj]
-            else:
-                maxsf = maxsf_input
-            if hasattr(radius_dist_input, '__len__'):
-                radius_dist = radius_dist_input[jj]
-            else:
-                radius_dist = radius_dist_input
-            if hasattr(radius_mag_input, '__len__'):
-                radius_mag = radius_mag_input[jj]
-            else:
-                radius_mag = radius_mag_input
-
-            # For each intensity measure investigated
-            for im in np.arange(len(intensity_measures)):
-
-                name = intensity_measures[im] + '-site_' + str(
-                    site) + '-poe-' + str(poe)
-
-                # Print some on screen feedback
-                print('Processing ' + name + ' Case: ' + str(ind) + '/' + str(
-                    len(site_code) * len(probability_of_exceedance_num) * len(
-                        intensity_measures)))
-                ind += 1
-
-                [im_star, rjb, mag] = \
-                    compute_conditioning_value(rlz, intensity_measures[im],
-                                               site, poe, num_disagg,
-                                               probability_of_exceedance[jj],
-                                               num_classical,
-                                               path_results_disagg,
-                                               investigation_time,
-                                               path_results_classical)
-
-                [bgmpe, sctx, rctx, dctx, vs30, rrup] = \
-                    inizialize_gmm(ii, gmpe_input, rjb, mag, hypo_depth, dip,
-                                   rake, upper_sd, lower_sd, azimuth, fhw,
-                                   vs30type, vs30, z2pt5, z1pt0)
-
-                # Screen the database of available ground motions
-
-                [sa_known, ind_per, tgt_per, n_big, allowed_index, event_id,
-                 station_code, source, record_sequence_number_nga, event_mw,
-                 event_mag, acc_distance, station_vs30, station_ec8] = \
-                    screen_database(database_path, allowed_database,
-                                    allowed_recs_vs30, radius_dist, radius_mag,
-                                    rjb, mag, allowed_ec8_code,
-                                    target_periods, n_gm, allowed_depth, vs30)
-
-                # Compute the target spectrum
-
-                [mean_req, cov_req, stdevs] = \
-                    compute_cs(tgt_per, bgmpe, sctx, rctx, dctx, im_type[im],
-                               tstar[im], rrup, mag, avg_periods, corr_type,
-                               im_star, gmpe_input)
-
-                simulated_spectra = simulate_spectra(random_seed,
-                                                     n_trials,
-                                                     mean_req,
-                                                     cov_req,
-                                                     stdevs,
-                                                     n_gm,
-                                                     weights)
-
-                [sample_small, sample_big, id_sel, ln_sa1,
-                 rec_id, im_scale_fac] = \
-                    find_ground_motion(tgt_per, tstar[im], avg_periods,
-                                       intensity_measures[im], n_gm,
-                                       sa_known, ind_per, mean_req,
-                                       n_big, simulated_spectra, maxsf)
-
-                # Further optimize the ground motion selection
-
-                [final_records, final_scale_factors, sample_small] = \
-                    optimize_ground_motion(n_loop, n_gm, sample_small, n_big,
-                                             id_sel, ln_sa1, maxsf, sample_big,
-                                             tgt_per, mean_req, stdevs, weights,
-                                             penalty, rec_id,
-                                             im_scale_fac)
-
-                # Create the outputs folder
-                folder = output_folder + '/' + name
-                if not os.path.exists(folder):
-                    os.makedirs(folder)
-
-                # Plot the figure
-                plot_final_selection(name, im_type_lbl[im], n_gm, tgt_per,
-                                     sample_small, mean_req, stdevs,
-                                     output_folder)
-
-                # Collect information of the final record set
-                rec_idx = [allowed_index[i] for i in final_records]
-                # Create the summary file along with the file with the CS
-                create_output_files(output_folder, name, im_star, mag,
-                                    rjb[0], n_gm, rec_idx, source, event_id,
-                                    station_code, event_mw, acc_distance,
-                                    station_vs30, station_ec8,
-                                    final_scale_factors, tgt_per, mean_req,
-                                    stdevs, record_sequence_number_nga,
-                                    event_mag)
+
+    if spectra_store is not None:
+        prepare_spectra_store(database_path, spectra_store)
+    # the database file is read once for all cases
+    inputs['database'] = read_database(database_path, spectra_store)
+
+    cases = list_cases(site_code, probability_of_exceedance_num,
+                       intensity_measures)
+    if n_jobs == 1:
+        selection_case(cases, **inputs)
+    else:
+        run_tasks([inputs], case_tasks(0, cases, warm_start), n_jobs)
 
     return
@@ -0,0 +1,179 @@
+# Copyright (C) 2020-2021 Elisa Zuccolo, Eucentre Foundation
+#
+# haselREC is free software: you can redistribute it and/or modify it
+# under the terms of the GNU Affero General Public License as published
+# by the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# haselREC is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with haselREC. If not, see <http://www.gnu.org/licenses/>.
+
+"""
+Long-running selection server (mode :code:`--serve`). It accepts selection
+jobs over HTTP on the local host and runs them with :code:`select` on a pool
+of processes, which keep the database, the GMM classes and the Akkar
+correlation table in memory between the jobs.
+"""
+
+
+def serve(host='127.0.0.1', port=8000, n_jobs=1):
+    """
+    Serves selection jobs on `http://<host>:<port>` with a pool of
+    :code:`n_jobs` processes, until interrupted (Ctrl-C).
+
+    The server has no authentication and the jobs read and write files with
+    the permissions of the server (database, OpenQuake results, output
+    folder), so :code:`host` must be a loopback address (e.g. `127.0.0.1`
+    or `localhost`).
+
+    A job is a `POST /select` request (content type `application/json`)
+    whose body is a JSON object with:
+
+        - :code:`ini`: content of an input file (relative paths refer to the
+          working directory of the server), or :code:`config`: the fields of
+          a :code:`SelectionConfig`
+        - :code:`overrides`: (optional) fields of the configuration to be
+          replaced, e.g. :code:`{"penalty": 1}`
+        - :code:`output_files`, :code:`plot`: (optional) true to write the
+          output files or the figures (default false)
+
+    The response is a JSON object with the screen output of the job
+    (:code:`output`), the error message, if any (:code:`error`), and the
+    results of the cases (:code:`results`, see
+    :code:`SelectionResult.to_dict`). `GET /status` returns the version and
+    the number of processes.
+    """
+    import sys
+    import json
+    import socket
+    import ipaddress
+    from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+    from concurrent.futures import ProcessPoolExecutor
+    from . import __version__
+
+    try:
+        addresses = {info[4][0] for info in socket.getaddrinfo(host, port)}
+    except socket.gaierror:
+        sys.exit('Error: unknown host ' + host)
+    if not all(ipaddress.ip_address(address.split('%')[0]).is_loopback
+               for address in addresses):
+        sys.exit('Error: the server has no authentication, so it can only '
+                 'listen on a loopback address (e.g. 127.0.0.1), not on '
+                 + host)
+
+    executor = ProcessPoolExecutor(n_jobs)
+    # the processes are started before the threads of the server
+    list(executor.map(abs, range(n_jobs)))
+
+    class Handler(BaseHTTPRequestHandler):
+
+        def send_json(self, status, content):
+            body = json.dumps(content).encode()
+            self.send_response(status)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def do_GET(self):
+            if self.path != '/status':
+                self.send_json(404, {'error': 'Unknown path ' + self.path})
+                return
+            self.send_json(200, {'version': __version__, 'jobs': n_jobs})
+
+        def do_POST(self):
+            if self.path != '/select':
+                self.send_json(404, {'error': 'Unknown path ' + self.path})
+                return
+            # a web page cannot send a JSON request to the server without
+            # its consent (CORS preflight), while it can send plain text
+            if self.headers.get_content_type() != 'application/json':
+                self.send_json(415, {'error': 'The job must be sent as '
+                                              'application/json'})
+                return
+            length = int(self.headers.get('Content-Length', 0))
+            try:
+                request = json.loads(self.rfile.read(length))
+            except ValueError:
+                self.send_json(400, {'error': 'The job must be a JSON '
+                                              'object'})
+                return
+            response = executor.submit(run_job, request).result()
+            self.send_json(200 if response['error'] is None else 400,
+                           response)
+
+    server = ThreadingHTTPServer((host, port), Handler)
+    print('Serving selection jobs on http://' + host + ':' +
+          str(server.server_port) + ' (Ctrl-C to stop)')
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        executor.shutdown(cancel_futures=True)
+
+
+def run_job(request):
+    """
+    Runs the selection job :code:`request` (see :code:`serve`) in a process
+    of the pool. The screen output is captured and an error
+    (:code:`sys.exit`) is returned as a message.
+    """
+    import io
+    import os
+    import dataclasses
+    import tempfile
+    import traceback
+    from contextlib import redirect_stdout
+    from .selection_api import SelectionConfig, select
+
+    output = io.StringIO()
+    error = None
+    results = []
+    with redirect_stdout(output):
+        try:
+            if 'ini' in request:
+                with tempfile.NamedTemporaryFile('w', suffix='.ini',
+                                                 delete=False) as f:
+                    f.write(request['ini'])
+                try:
+                    config = SelectionConfig.from_ini(f.name)
+                finally:
+                    os.remove(f.name)
+            else:
+                config = SelectionConfig(**_from_json(request['config']))
+            config = dataclasses.replace(
+                config, **_from_json(request.get('overrides', {})))
+            results = [result.to_dict() for result in
+                       select(config, bool(request.get('output_files')),
+                              bool(request.get('plot')))]
+        except SystemExit as exit_error:
+            error = str(exit_error.code)
+        except Exception:
+            error = traceback.format_exc()
+    return {'output': output.getvalue(), 'error': error, 'results': results}
+
+
+def _from_json(fields):
+    """
+    Converts the lists of numbers of the configuration :code:`fields` read
+    from JSON to arrays, as read by :code:`read_input_data`.
+    """
+    import numbers
+    import numpy as np
+
+    if not isinstance(fields, dict):
+        raise TypeError('The configuration must be a JSON object')
+    values = {}
+    for key, value in fields.items():
+        if isinstance(value, list) and value and all(
+                isinstance(x, numbers.Number) for x in value):
+            value = np.array(value)
+        values[key] = value
+    return values
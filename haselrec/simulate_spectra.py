@@ -14,36 +14,68 @@
 # along with haselREC. If not, see <http://www.gnu.org/licenses/>.
 
 def simulate_spectra(random_seed, n_trials, mean_req, cov_req, stdevs, n_gm,
-                     weights):
+                     weights, trials_tol=None, max_trials=None,
+                     max_trials_time=None):
     """
     Statistically simulates response spectra from the target distribution. From:
     Jayaram N, Lin T, Baker J. (2011). A Computationally Efficient Ground-Motion
     Selection Algorithm for Matching a Target Response Spectrum Mean and
     Variance. Earthq Spectra 2011;27:797-815. https://doi.org/10.1193/1.3608002.
+
+    By default :code:`n_trials` sets of spectra are simulated and the best one
+    is returned. When :code:`trials_tol` is specified, the number of trials is
+    adaptive: batches of :code:`n_trials` simulations are drawn until the
+    deviation of the best set improves by less than :code:`trials_tol` from
+    one batch to the next, or until :code:`max_trials` simulations (default
+    100 batches) or :code:`max_trials_time` seconds are reached. The number of
+    trials actually used is printed on screen.
     """
     # Import libraries
+    import time
     import numpy as np
     from scipy.stats import skew
 
     random = np.random.RandomState(random_seed)
+
+    if trials_tol is None:
+        max_trials = n_trials
+    elif max_trials is None:
+        max_trials = 100 * n_trials
+
     # simulate response spectra from the target mean and covariance matrix
-    dev_total_sim = []
-    spettri = []
-    for _ in np.arange(n_trials):
-        spectra_sample = np.exp(random.multivariate_normal(mean_req, cov_req,
-                                                           n_gm))
-        spettri.append(spectra_sample)
-        # evaluate simulation
-        sample_mean_err = np.mean(np.log(spectra_sample), axis=0) - mean_req
-        sample_std_err = np.std(np.log(spectra_sample), axis=0) - stdevs
-        sample_skewness_err = skew(np.log(spectra_sample), axis=0, bias=True)
-        dev_total_sim.append(
-            weights[0] * sum(sample_mean_err ** 2) + weights[1] **
-            sum(sample_std_err ** 2) + weights[2] *
-            sum(sample_skewness_err ** 2))
-
-    # find the simulated spectra that best match the target
-    best_sample = dev_total_sim.index(min(dev_total_sim))
+    start = time.time()
+    min_dev = np.inf
+    simulated_spectra = None
+    n_used = 0
+    while n_used < max_trials:
+        previous_dev = min_dev
+        for _ in np.arange(min(n_trials, max_trials - n_used)):
+            spectra_sample = np.exp(random.multivariate_normal(mean_req,
+                                                               cov_req, n_gm))
+            # evaluate simulation
+            sample_mean_err = np.mean(np.log(spectra_sample),
+                                      axis=0) - mean_req
+            sample_std_err = np.std(np.log(spectra_sample), axis=0) - stdevs
+            sample_skewness_err = skew(np.log(spectra_sample), axis=0,
+                                       bias=True)
+            dev_total = weights[0] * sum(sample_mean_err ** 2) + weights[1] ** \
+                sum(sample_std_err ** 2) + weights[2] * \
+                sum(sample_skewness_err ** 2)
+            n_used += 1
+            # keep the simulated spectra that best match the target
+            if dev_total < min_dev:
+                min_dev = dev_total
+                simulated_spectra = spectra_sample
+
+        if trials_tol is not None:
+            if previous_dev - min_dev <= trials_tol:
+                break
+            if (max_trials_time is not None and
+                    time.time() - start >= max_trials_time):
+                break
+
+    if trials_tol is not None:
+        print(['Number of simulation trials used = ', n_used])
+
     # return the best set of simulations
-    simulated_spectra = spettri[best_sample]
     return simulated_spectra
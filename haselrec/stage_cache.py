@@ -0,0 +1,100 @@
+# Copyright (C) 2020-2021 Elisa Zuccolo, Eucentre Foundation
+#
+# haselREC is free software: you can redistribute it and/or modify it
+# under the terms of the GNU Affero General Public License as published
+# by the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# haselREC is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with haselREC. If not, see <http://www.gnu.org/licenses/>.
+
+"""
+Cache of the outputs of the stages of the selection: `conditioning`
+(conditioning value), `screening`, `target` (conditional spectrum),
+`pruning`, `simulation`, `matching` and `optimization`.
+
+Each stage declares its inputs: parameters, input files and the keys of the
+upstream stages it depends on. Its output is stored as an artifact named
+after the key computed from these inputs, so that a change of a parameter
+invalidates only the stages depending on it, directly or through the
+upstream keys.
+"""
+
+
+def stage_key(stage, inputs, files=()):
+    """
+    Returns the key of the :code:`stage` for the :code:`inputs` (dictionary
+    of parameters and keys of the upstream stages) and the input
+    :code:`files`, computed as the fingerprint of the stage
+    (:code:`case_fingerprint`).
+    """
+    from .fingerprint import case_fingerprint
+
+    return case_fingerprint(dict(inputs, stage=stage), files)
+
+
+def cached_stage(cache_folder, stage, inputs, compute, files=(),
+                 checkpoint=None):
+    """
+    Returns the key of the :code:`stage` (:code:`stage_key`) and its output.
+    The output is read from the artifact
+    `<cache_folder>/<stage>-<key>.pkl`, if it exists, otherwise it is
+    computed by calling :code:`compute()` and stored.
+
+    Nothing is read or stored when :code:`cache_folder` is None. The output
+    is not stored if the file :code:`checkpoint` exists after the
+    computation (interrupted optimization); when the output is read from the
+    cache, a checkpoint left by an earlier interrupted run is stale and it is
+    removed. The stage, computed or read, is measured by
+    :code:`stage_metrics`.
+    """
+    from .metrics import stage_metrics
+
+    with stage_metrics(stage):
+        return _cached_stage(cache_folder, stage, inputs, compute, files,
+                             checkpoint)
+
+
+def _cached_stage(cache_folder, stage, inputs, compute, files, checkpoint):
+    """
+    Reads or computes the output of the stage (see :code:`cached_stage`).
+    """
+    import os
+    import pickle
+    from .metrics import count
+    from .checkpoint import remove_checkpoint
+
+    key = stage_key(stage, inputs, files)
+    if cache_folder is None:
+        return key, compute()
+
+    artifact = cache_folder + '/' + stage + '-' + key + '.pkl'
+    if os.path.isfile(artifact):
+        try:
+            with open(artifact, 'rb') as f:
+                output = pickle.load(f)
+            print('Stage ' + stage + ' read from the cache')
+            count('cache_hits')
+            remove_checkpoint(checkpoint)
+            return key, output
+        except (OSError, EOFError, pickle.UnpicklingError):
+            print('Warning: the artifact ' + artifact + ' cannot be read '
+                  'and it is computed again')
+
+    output = compute()
+    if checkpoint is not None and os.path.exists(checkpoint):
+        return key, output
+    if not os.path.exists(cache_folder):
+        os.makedirs(cache_folder, exist_ok=True)
+    # the artifact is first written to a temporary file (unique for each
+    # process) and then renamed
+    temporary = artifact + '.' + str(os.getpid()) + '.tmp'
+    with open(temporary, 'wb') as f:
+        pickle.dump(output, f, protocol=pickle.HIGHEST_PROTOCOL)
+    os.replace(temporary, artifact)
+    return key, output
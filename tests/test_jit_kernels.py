@@ -0,0 +1,50 @@
+"""
+The NumPy and Numba backends must select the same records.
+"""
+
+import numpy as np
+import pytest
+
+pytest.importorskip('numba')
+
+from haselrec.find_ground_motion import find_ground_motion  # noqa: E402
+from haselrec.optimize_ground_motion import optimize_ground_motion  # noqa: E402
+
+
+def synthetic_case(n_big=300, n_gm=10, seed=1):
+    rng = np.random.RandomState(seed)
+    tgt_per = np.array([0., 0.01, 0.1, 0.2, 0.3, 0.4, 0.5])
+    ind_per = np.array([0, 1, 6, 8, 10, 12, 14])
+    sa_known = np.exp(rng.normal(-1.5, 0.8, (n_big, 36)))
+    mean_req = np.linspace(-1., -1.5, len(tgt_per))
+    stdevs = np.linspace(0.3, 0.6, len(tgt_per))
+    stdevs[0] = 1e-5
+    simulated_spectra = np.exp(rng.multivariate_normal(
+        mean_req, np.diag(stdevs ** 2), n_gm))
+    return tgt_per, ind_per, sa_known, mean_req, stdevs, simulated_spectra
+
+
+def select(backend):
+    n_gm = 10
+    tgt_per, ind_per, sa_known, mean_req, stdevs, simulated_spectra = \
+        synthetic_case(n_gm=n_gm)
+    n_big = sa_known.shape[0]
+    [sample_small, sample_big, id_sel, ln_sa1, rec_id, im_scale_fac] = \
+        find_ground_motion(tgt_per, np.array([0.]), [], 'PGA', n_gm,
+                           sa_known, ind_per, mean_req, n_big,
+                           simulated_spectra, 5., 'greedy', backend)
+    matched = np.array(rec_id)
+    rec_id, im_scale_fac, sample_small, trace = \
+        optimize_ground_motion(2, n_gm, sample_small, n_big, id_sel, ln_sa1,
+                               5., sample_big, tgt_per, mean_req, stdevs,
+                               np.array([1., 2., 0.3]), 10., rec_id,
+                               im_scale_fac, backend=backend)
+    return matched, np.array(rec_id), np.array(im_scale_fac)
+
+
+def test_backends_select_identical_records():
+    matched_numpy, rec_id_numpy, scale_numpy = select('numpy')
+    matched_numba, rec_id_numba, scale_numba = select('numba')
+    np.testing.assert_array_equal(matched_numpy, matched_numba)
+    np.testing.assert_array_equal(rec_id_numpy, rec_id_numba)
+    np.testing.assert_allclose(scale_numpy, scale_numba)
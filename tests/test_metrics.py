@@ -0,0 +1,42 @@
+"""
+Each stage appends one JSON record with its counters to the metrics file,
+and nothing is recorded without a metrics file.
+"""
+
+import json
+import tracemalloc
+
+from haselrec import metrics
+
+
+def test_stage_appends_one_record(tmp_path):
+    tracing = tracemalloc.is_tracing()
+    metrics_file = tmp_path / 'metrics.jsonl'
+    metrics.start_metrics(str(metrics_file), 'PGA-site_0-poe-0')
+    with metrics.stage_metrics('optimization', n_big=300):
+        metrics.count('swaps')
+        metrics.count('candidate_evaluations', 40)
+        metrics.count('swaps')
+    metrics.start_metrics(None, None)
+
+    lines = metrics_file.read_text().splitlines()
+    assert len(lines) == 1
+    record = json.loads(lines[0])
+    assert record['case'] == 'PGA-site_0-poe-0'
+    assert record['stage'] == 'optimization'
+    assert record['n_big'] == 300
+    assert record['swaps'] == 2
+    assert record['candidate_evaluations'] == 40
+    assert 'rss' in record and 'max_rss' in record
+    assert 'error' not in record
+    # tracemalloc is only used when already started
+    assert tracemalloc.is_tracing() == tracing
+    assert ('peak_memory' in record) == tracing
+
+
+def test_count_without_metrics_file():
+    metrics.start_metrics(None, 'PGA-site_0-poe-0')
+    with metrics.stage_metrics('optimization') as counters:
+        metrics.count('swaps')
+    assert counters is None
+    assert metrics._state['counters'] is None
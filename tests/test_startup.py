@@ -0,0 +1,23 @@
+"""
+The command line must start without importing the heavy dependencies.
+"""
+
+import os
+import subprocess
+import sys
+
+HEAVY_MODULES = ['numpy', 'pandas', 'scipy', 'openquake']
+
+
+def test_main_does_not_import_heavy_modules():
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    result = subprocess.run(
+        [sys.executable, '-X', 'importtime', '-c', 'import haselrec.__main__'],
+        cwd=root, capture_output=True, text=True, check=True)
+    # each line of the report ends with the name of the imported module
+    imported = {line.rsplit('|', 1)[-1].strip().split('.')[0]
+                for line in result.stderr.splitlines()
+                if line.startswith('import time:')}
+    assert 'haselrec' in imported
+    for module in HEAVY_MODULES:
+        assert module not in imported